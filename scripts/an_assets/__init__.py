@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the AN Milk Tea image asset scripts.
+The scripts in scripts/ import this package from their own directory.
+"""
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Asset pipeline entry point. Run from the scripts/ folder:
+
+    python -m an_assets build                      # every default stage
+    python -m an_assets build --only 'tra-sua*'    # just those products
+    python -m an_assets build download variants    # named stages only
+    python -m an_assets list                       # stages, dependencies, status
+"""
+
+import argparse
+import io
+import os
+import sys
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+from . import trace
+from .pipeline import (BLOCKED, FAILED, OK, PARTIAL, SKIPPED, STAGES, Pipeline, StageRun, dependencies,
+                       select_stages, topological)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m an_assets', description="AN Milk Tea image asset pipeline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Run stages whose inputs changed, independent ones concurrently")
+    build.add_argument('stages', nargs='*', metavar='STAGE',
+                       help=f"Stages to run (default: every default stage). One of: "
+                            f"{', '.join(stage.name for stage in STAGES)}")
+    build.add_argument('--only', action='append', metavar='PATTERN',
+                       help="Only build products whose code matches this glob, e.g. 'tra-sua*'; repeatable")
+    build.add_argument('--jobs', '-j', type=int, default=2, metavar='N',
+                       help="Stages to run at once (default 2)")
+    build.add_argument('--force', action='store_true',
+                       help="Run every selected stage even if its stamp is current")
+    build.add_argument('--verbose', '-v', action='store_true',
+                       help="Print each stage's full output instead of its summary")
+    build.add_argument('--trace', type=Path, metavar='DIR',
+                       help="Write a JSON / Chrome trace report per stage, plus pipeline.json, to DIR")
+    build.add_argument('--profile', action='store_true',
+                       help="Also run cProfile in every stage and save .prof files next to the traces")
+
+    listing = commands.add_parser('list', help="Show stages in build order with their dependencies")
+    listing.add_argument('stages', nargs='*', metavar='STAGE')
+    return parser.parse_args()
+
+
+def summary(output: str) -> str:
+    """The lines after a script's last ===== separator."""
+    lines = output.rstrip().splitlines()
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i].startswith('====='):
+            return '\n'.join(lines[i + 1:])
+    return '\n'.join(lines[-5:])
+
+
+def main():
+    args = parse_args()
+    try:
+        stages = topological(select_stages(args.stages))
+    except KeyError as e:
+        print(f"Error: unknown stage(s): {e.args[0]}")
+        sys.exit(1)
+
+    if args.command == 'list':
+        pipeline = Pipeline(stages)
+        deps = dependencies(stages)
+        for stage in stages:
+            status = 'up to date' if pipeline.is_fresh(stage, pipeline.stamp(stage)) else 'stale'
+            after = ', '.join(sorted(deps[stage.name])) or '-'
+            print(f"  {stage.name:<14} {status:<11} after: {after}")
+        return
+
+    print("AN Milk Tea - Asset Pipeline")
+    print(f"Stages: {', '.join(stage.name for stage in stages)}")
+    if args.only:
+        print(f"Products: {', '.join(args.only)}")
+    print("=" * 50)
+
+    def report(run: StageRun) -> None:
+        label = {OK: 'OK', PARTIAL: 'PARTIAL', FAILED: 'ERROR', SKIPPED: 'SKIP', BLOCKED: 'BLOCKED'}[run.status]
+        print(f"[{label}] {run.stage.name} ({run.seconds:.1f}s)")
+        if run.output and (args.verbose or run.status == FAILED):
+            text = run.output.rstrip()
+        elif run.output:
+            text = summary(run.output)
+        else:
+            return
+        for line in text.splitlines():
+            print(f"    {line}")
+
+    # Stage scripts pick tracing up from the environment, so it stays out of their stamps
+    if args.profile:
+        os.environ[trace.PROFILE_ENV] = '1'
+    if args.trace:
+        os.environ[trace.TRACE_DIR_ENV] = str(args.trace.resolve())
+        trace.start(argparse.Namespace(trace=args.trace / 'pipeline.json'), 'pipeline')
+
+    pipeline = Pipeline(stages, only=args.only, force=args.force)
+    results = pipeline.run(args.jobs, report)
+
+    counts = {status: sum(1 for run in results if run.status == status)
+              for status in (OK, PARTIAL, FAILED, SKIPPED, BLOCKED)}
+    print("\n" + "=" * 50)
+    print(f"Success: {counts[OK]}")
+    print(f"Failed: {counts[FAILED] + counts[PARTIAL]}")
+    print(f"Skipped: {counts[SKIPPED]}")
+    if counts[BLOCKED]:
+        print(f"Blocked: {counts[BLOCKED]}")
+    if counts[FAILED] or counts[PARTIAL]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
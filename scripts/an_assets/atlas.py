@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Sprite atlas packing for product thumbnails.
+
+Thumbnails are packed with shelf packing (tallest first, left to right,
+new shelf when a row is full, new sheet when a sheet is full). Identical
+thumbnails share one slot.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from PIL import Image
+
+MAX_SHEET_SIZE = 2048
+PADDING = 2
+
+
+@dataclass(frozen=True)
+class Slot:
+    sheet: int
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+def sheet_width(sizes: Sequence[Tuple[int, int]], max_size: int, padding: int) -> int:
+    """Width that makes one sheet roughly square, capped at max_size."""
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    widest = max(w for w, _ in sizes) + padding
+    return min(max_size, max(widest, math.ceil(math.sqrt(area))))
+
+
+def shelf_pack(sizes: Sequence[Tuple[int, int]], max_size: int = MAX_SHEET_SIZE,
+               padding: int = PADDING) -> Tuple[List[Slot], List[Tuple[int, int]]]:
+    """
+    Place rectangles on as few sheets as needed.
+    Returns (slot per input, in input order; (width, height) per sheet).
+    """
+    if not sizes:
+        return [], []
+    if any(w + padding > max_size or h + padding > max_size for w, h in sizes):
+        raise ValueError(f"Thumbnail larger than the {max_size}px sheet")
+
+    width = sheet_width(sizes, max_size, padding)
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+
+    slots: Dict[int, Slot] = {}
+    sheets: List[Tuple[int, int]] = []
+    sheet, x, y, shelf_height, used_width = 0, 0, 0, 0, 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w + padding > width:
+            # Next shelf
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + h + padding > max_size:
+            # Next sheet
+            sheets.append((used_width, y))
+            sheet, x, y, shelf_height, used_width = sheet + 1, 0, 0, 0, 0
+        slots[i] = Slot(sheet, x, y, w, h)
+        x += w + padding
+        shelf_height = max(shelf_height, h + padding)
+        used_width = max(used_width, x)
+    sheets.append((used_width, y + shelf_height))
+
+    return [slots[i] for i in range(len(sizes))], sheets
+
+
+def render_sheets(images: Sequence[Image.Image], slots: Sequence[Slot],
+                  sheets: Sequence[Tuple[int, int]], background=(255, 255, 255)) -> List[Image.Image]:
+    """Paste images into their slots on new RGB sheets."""
+    canvases = [Image.new('RGB', size, background) for size in sheets]
+    for image, slot in zip(images, slots):
+        canvases[slot.sheet].paste(image, (slot.x, slot.y))
+    return canvases
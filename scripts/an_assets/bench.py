@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Timing, peak memory and result history for the asset benchmarks.
+
+Each case is timed over several repeats after one warm-up call; the median
+is the headline number. Peak RSS comes from getrusage, which only ever
+grows, so benchmark-assets.py runs every case in its own process. Runs are
+appended to a JSON history so a change can be compared with earlier runs.
+Quality reports have no timings and go to a history of their own.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .cache import CACHE_DIR
+from .files import atomic_write_text
+
+HISTORY_PATH = CACHE_DIR / 'bench' / 'history.json'
+QUALITY_HISTORY_PATH = CACHE_DIR / 'bench' / 'quality.json'
+
+
+@dataclass
+class BenchResult:
+    case: str
+    repeats: int
+    seconds_median: float
+    seconds_min: float
+    # Work done by one call
+    images: int
+    pixels: int
+    peak_rss_mb: Optional[float]
+
+    @property
+    def images_per_s(self) -> float:
+        return self.images / self.seconds_median if self.seconds_median else 0.0
+
+    @property
+    def megapixels_per_s(self) -> float:
+        return self.pixels / 1e6 / self.seconds_median if self.seconds_median else 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data['images_per_s'] = round(self.images_per_s, 3)
+        data['megapixels_per_s'] = round(self.megapixels_per_s, 3)
+        return data
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(case: str, run: Callable[[], None], images: int, pixels: int, repeats: int = 5) -> BenchResult:
+    """Time run() repeats times after one warm-up call."""
+    run()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return BenchResult(case, repeats, statistics.median(times), min(times), images, pixels, peak_rss_mb())
+
+
+def environment() -> Dict[str, object]:
+    """Where a run happened, so history entries are compared like for like."""
+    info: Dict[str, object] = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'cpus': os.cpu_count(),
+    }
+    try:
+        import numpy
+        import PIL
+        info['numpy'] = numpy.__version__
+        info['pillow'] = PIL.__version__
+    except ImportError:
+        pass
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                        cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def load_history(path: Path = HISTORY_PATH) -> List[dict]:
+    if not path.exists():
+        return []
+    try:
+        return json.loads(path.read_text(encoding='utf-8')).get('runs', [])
+    except (OSError, ValueError):
+        return []
+
+
+def append_history(run: dict, path: Path = HISTORY_PATH) -> None:
+    runs = load_history(path)
+    runs.append(run)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(path, json.dumps({'runs': runs}, indent=2) + '\n')
+
+
+def find_baseline(runs: List[dict], label: Optional[str] = None) -> Optional[dict]:
+    """
+    The newest timed run with this label, or the newest timed run if label
+    is None. Runs without 'results' (quality reports written by older
+    versions into the same history) are skipped.
+    """
+    for run in reversed(runs):
+        if 'results' not in run:
+            continue
+        if label is None or run.get('label') == label:
+            return run
+    return None
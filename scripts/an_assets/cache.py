@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed build cache for generated images.
+
+Each output is stored under a key hashed from everything that affects its
+bytes (template file, target color, profile, resize/quality, version), so
+an output that was removed or overwritten can be restored instead of
+rebuilt. Which outputs are stale is tracked by the manifest (manifest.py).
+The cache has a size cap with least-recently-used eviction.
+"""
+
+import hashlib
+import json
+import secrets
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .files import atomic_writer
+
+CACHE_DIR = Path(__file__).parent.parent.parent / '.cache' / 'an-assets'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable SHA-256 key for JSON-serializable build parameters."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BuildCache:
+    """
+    On-disk cache of built outputs keyed by cache_key().
+    index.json tracks each cached object's size, hash and last use.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = root / 'index.json'
+        self.objects: Dict[str, Dict[str, Any]] = self._load()
+        # Entries this run added, touched (dict) or dropped (None), merged by save()
+        self._dirty: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            return json.loads(self.index_path.read_text(encoding='utf-8')).get('objects', {})
+        except (OSError, ValueError):
+            # A corrupt index only costs a rebuild
+            return {}
+
+    def _drop(self, key: str) -> None:
+        self._object_path(key).unlink(missing_ok=True)
+        self.objects.pop(key, None)
+        self._dirty[key] = None
+
+    def _object_path(self, key: str) -> Path:
+        return self.root / 'objects' / key[:2] / key
+
+    def restore(self, key: str, output_path: Path) -> bool:
+        """
+        Copy a cached object to output_path. Returns False on a cache miss,
+        including an object whose size or hash no longer matches the index
+        (it is dropped rather than copied into the output).
+        """
+        entry = self.objects.get(key)
+        obj = self._object_path(key)
+        if not entry or not obj.exists():
+            if entry:
+                self._drop(key)
+            return False
+        if obj.stat().st_size != entry.get('size') or file_digest(obj) != entry.get('sha256'):
+            self._drop(key)
+            return False
+
+        # Replace rather than overwrite, in case output_path is a hardlink
+        with atomic_writer(output_path) as f, open(obj, 'rb') as src:
+            shutil.copyfileobj(src, f)
+        entry['used'] = time.time()
+        self._dirty[key] = entry
+        return True
+
+    def store(self, key: str, output_path: Path) -> None:
+        """Keep a copy of a freshly built output under key."""
+        obj = self._object_path(key)
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output_path, obj)
+
+        self.objects[key] = {
+            'size': obj.stat().st_size,
+            'sha256': file_digest(obj),
+            'used': time.time(),
+        }
+        self._dirty[key] = self.objects[key]
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least-recently-used objects until the cache fits max_bytes."""
+        total = sum(entry['size'] for entry in self.objects.values())
+        removed = 0
+        for key, entry in sorted(self.objects.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            self._drop(key)
+            total -= entry['size']
+            removed += 1
+        return removed
+
+    def save(self) -> None:
+        """
+        Write the index; call once at the end of a run. The file is re-read
+        first and this run's changes merged in, so scripts that run at the
+        same time keep each other's entries (and the size cap sees them).
+        """
+        if not self._dirty:
+            return
+
+        objects = self._load()
+        for key, entry in self._dirty.items():
+            if entry is None:
+                objects.pop(key, None)
+            else:
+                objects[key] = entry
+        self.objects = objects
+        # Entries merged from other runs count towards the cap as well
+        self.evict()
+        self._dirty = {}
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(f'.index.{secrets.token_hex(4)}.tmp')
+        tmp.write_text(json.dumps({'objects': self.objects}, indent=1), encoding='utf-8')
+        tmp.replace(self.index_path)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Product catalogue shared by every image stage.
+
+catalog.json (or a TOML file with the same layout) lists each product once
+with what the stages need: the Imagen prompt, the drink and paper-cup
+recolor targets and the stock photo URL. A stage uses the products that
+have its section; a missing section means the stage has nothing to build
+for that product. Product.digest() hashes only the sections a stage reads,
+so editing one product's cup color invalidates that product's cup output
+and nothing else.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .cache import cache_key
+
+CATALOG_PATH = Path(__file__).parent / 'catalog.json'
+
+RGB = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class Product:
+    code: str
+    name: str
+    category: str
+    # Fallback image for its category
+    is_default: bool = False
+    # Imagen prompt: drink color/appearance and toppings
+    color: Optional[str] = None
+    toppings: Optional[str] = None
+    # Drink recolor target and template ('milktea' or 'fruittea')
+    drink_rgb: Optional[RGB] = None
+    drink_template: Optional[str] = None
+    # Paper cup recolor target
+    cup_rgb: Optional[RGB] = None
+    stock_url: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.code}.jpg"
+
+    def digest(self, *fields: str) -> str:
+        """Hash of the given fields (all fields if none), for change detection."""
+        values = asdict(self)
+        return cache_key(*[(field, values[field]) for field in (fields or values)])
+
+
+def selected(code: str, patterns: Optional[Sequence[str]]) -> bool:
+    """True if code matches any --only glob pattern (or no patterns were given)."""
+    return not patterns or any(fnmatchcase(code, pattern) for pattern in patterns)
+
+
+def _rgb(value) -> Optional[RGB]:
+    return tuple(int(channel) for channel in value) if value is not None else None
+
+
+def _product(entry: dict) -> Product:
+    prompt = entry.get('prompt') or {}
+    drink = entry.get('drink') or {}
+    cup = entry.get('cup') or {}
+    return Product(
+        code=entry['code'],
+        name=entry['name'],
+        category=entry['category'],
+        is_default=bool(entry.get('default', False)),
+        color=prompt.get('color'),
+        toppings=prompt.get('toppings'),
+        drink_rgb=_rgb(drink.get('rgb')),
+        drink_template=drink.get('template'),
+        cup_rgb=_rgb(cup.get('rgb')),
+        stock_url=entry.get('stock'),
+    )
+
+
+class Catalog:
+    """Products in file order, indexed by code and by category."""
+
+    def __init__(self, products: List[Product], categories: Optional[Dict[str, str]] = None):
+        self.products = list(products)
+        self.categories = dict(categories or {})
+        self._by_code: Dict[str, Product] = {}
+        self._by_category: Dict[str, List[Product]] = {}
+        for product in self.products:
+            if product.code in self._by_code:
+                raise ValueError(f"Duplicate product code in catalogue: {product.code}")
+            self._by_code[product.code] = product
+            self._by_category.setdefault(product.category, []).append(product)
+
+    def __iter__(self) -> Iterator[Product]:
+        return iter(self.products)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._by_code
+
+    def __getitem__(self, code: str) -> Product:
+        return self._by_code[code]
+
+    def get(self, code: str) -> Optional[Product]:
+        return self._by_code.get(code)
+
+    def in_category(self, category: str) -> List[Product]:
+        return list(self._by_category.get(category, []))
+
+    def default_for(self, category: str) -> Optional[Product]:
+        return next((p for p in self._by_category.get(category, []) if p.is_default), None)
+
+    def with_prompt(self) -> List[Product]:
+        return [p for p in self.products if p.color is not None]
+
+    def with_drink(self) -> List[Product]:
+        return [p for p in self.products if p.drink_rgb is not None]
+
+    def with_cup(self) -> List[Product]:
+        return [p for p in self.products if p.cup_rgb is not None]
+
+    def with_stock(self) -> List[Product]:
+        return [p for p in self.products if p.stock_url is not None]
+
+    def select(self, patterns: Optional[Sequence[str]]) -> 'Catalog':
+        """Products whose code matches any of the glob patterns; all if none."""
+        return Catalog([p for p in self.products if selected(p.code, patterns)], self.categories)
+
+    def changed(self, previous: Dict[str, str], *fields: str) -> List[str]:
+        """Codes whose digest of fields differs from previous {code: digest}, or are new."""
+        return [p.code for p in self.products if previous.get(p.code) != p.digest(*fields)]
+
+
+def load_catalog(path: Path = CATALOG_PATH) -> Catalog:
+    """Read a catalogue from JSON or TOML (by file extension)."""
+    path = Path(path)
+    if path.suffix == '.toml':
+        import tomllib  # Python 3.11+
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    return Catalog([_product(entry) for entry in data.get('products', [])], data.get('categories'))
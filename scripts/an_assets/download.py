@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel HTTP downloads over pooled keep-alive connections.
+
+Each worker thread keeps one open connection per host and reuses it for
+every request it sends there, so a batch from one CDN pays for the TLS
+handshake once per worker instead of once per file.
+
+Bodies land in an HttpCache that keeps each URL's ETag / Last-Modified.
+Later fetches send If-None-Match / If-Modified-Since, and a 304 leaves
+the cached body as it is. Bodies are streamed to a temp file with a
+running SHA-256, a size cap and a content check, then renamed into place,
+so a truncated or non-image response never replaces a good copy.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from .cache import CACHE_DIR, cache_key
+from .files import atomic_write_text, atomic_writer
+from .trace import span
+
+DEFAULT_WORKERS = 4
+TIMEOUT = 30
+MAX_REDIRECTS = 5
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# A reused keep-alive connection the server already closed fails with one of these
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           BrokenPipeError, ConnectionResetError)
+
+
+class DownloadError(Exception):
+    """A response that must not be stored (too large, truncated, not an image)."""
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Image MIME type from a file's first bytes, or None."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'image/avif'
+    return None
+
+
+def stream_to_file(response: http.client.HTTPResponse, path: Path,
+                   max_bytes: int = MAX_DOWNLOAD_BYTES) -> Tuple[str, int, str]:
+    """
+    Stream an image response body to path. Returns (sha256, size, mime type).
+
+    The body is written in chunks to a temp file that only replaces path if
+    it is complete, within max_bytes, and starts with image magic bytes
+    consistent with an image/* Content-Type. Raises DownloadError otherwise.
+    """
+    content_type = (response.getheader('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type and not content_type.startswith('image/') and content_type != 'application/octet-stream':
+        raise DownloadError(f"Not an image: Content-Type {content_type}")
+
+    length = response.getheader('Content-Length')
+    if length is not None and int(length) > max_bytes:
+        raise DownloadError(f"Too large: {int(length)} bytes (limit {max_bytes})")
+
+    digest = hashlib.sha256()
+    size = 0
+    mime = None
+    with atomic_writer(path) as f:
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0:
+                mime = sniff_image(chunk[:16])
+                if mime is None:
+                    raise DownloadError("Not an image: unrecognized file signature")
+            size += len(chunk)
+            if size > max_bytes:
+                raise DownloadError(f"Too large: over {max_bytes} bytes")
+            digest.update(chunk)
+            f.write(chunk)
+
+        if size == 0:
+            raise DownloadError("Empty response")
+        if length is not None and size != int(length):
+            raise DownloadError(f"Truncated: {size} of {length} bytes")
+
+    return digest.hexdigest(), size, mime
+
+
+def insecure_context() -> ssl.SSLContext:
+    """SSL context that doesn't verify certificates (for development)."""
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per host per thread."""
+
+    def __init__(self, context: Optional[ssl.SSLContext] = None, timeout: float = TIMEOUT):
+        self.context = context or insecure_context()
+        self.timeout = timeout
+        self.connects = 0
+        self.requests = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connection(self, scheme: str, netloc: str, fresh: bool = False) -> http.client.HTTPConnection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        key = (scheme, netloc)
+        conn = connections.get(key)
+        if conn is not None and not fresh:
+            return conn
+        if conn is not None:
+            conn.close()
+
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self.context)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        connections[key] = conn
+        with self._lock:
+            self.connects += 1
+            self._all.append(conn)
+        return conn
+
+    def _send(self, url: str, headers: Dict[str, str]) -> http.client.HTTPResponse:
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn = self._connection(parts.scheme, parts.netloc)
+        reused = conn.sock is not None
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            if not reused:
+                raise
+            # The server dropped an idle connection; retry once on a new one
+            conn = self._connection(parts.scheme, parts.netloc, fresh=True)
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+
+        with self._lock:
+            self.requests += 1
+        return response
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[str, http.client.HTTPResponse]:
+        """
+        GET url, following redirects. Returns (final url, response).
+        The caller must read the response to the end (or close it) before
+        the thread's next request to the same host.
+        """
+        headers = {'User-Agent': USER_AGENT, **(headers or {})}
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(url, headers)
+            location = response.getheader('Location')
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                return url, response
+            response.read()
+            url = urljoin(url, location)
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def discard(self, url: str) -> None:
+        """Close this thread's connection to url's host, e.g. after an abandoned body."""
+        parts = urlsplit(url)
+        conn = getattr(self._local, 'connections', {}).pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+
+
+class HttpCache:
+    """
+    On-disk HTTP cache: the last body of each URL plus its validators.
+    index.json maps url -> {etag, last_modified, sha256, size, fetched}.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR / 'http'):
+        self.root = Path(root)
+        self.index_path = self.root / 'index.json'
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        if self.index_path.exists():
+            try:
+                self.entries = json.loads(self.index_path.read_text(encoding='utf-8')).get('urls', {})
+            except (OSError, ValueError):
+                # A corrupt index only costs full downloads
+                self.entries = {}
+
+    def body_path(self, url: str) -> Path:
+        return self.root / 'bodies' / cache_key(url)
+
+    def entry(self, url: str) -> Optional[Dict[str, Any]]:
+        """Cache entry for url, if its body is still on disk at the recorded size."""
+        with self._lock:
+            entry = self.entries.get(url)
+        path = self.body_path(url)
+        if entry and path.exists() and path.stat().st_size == entry.get('size'):
+            return entry
+        return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since for a cached url."""
+        entry = self.entry(url)
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, response: http.client.HTTPResponse, max_bytes: int = MAX_DOWNLOAD_BYTES) -> None:
+        """Stream a fresh 200 body into the cache and keep its validators."""
+        sha256, size, mime = stream_to_file(response, self.body_path(url), max_bytes)
+        entry = {
+            'etag': response.getheader('ETag'),
+            'last_modified': response.getheader('Last-Modified'),
+            'content_type': mime,
+            'sha256': sha256,
+            'size': size,
+            'fetched': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        with self._lock:
+            self.entries[url] = entry
+
+    def revalidated(self, url: str) -> None:
+        """Note a 304 for url."""
+        with self._lock:
+            self.entries[url]['fetched'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+    def save(self) -> None:
+        """Write the index; call once at the end of a run."""
+        with self._lock:
+            atomic_write_text(self.index_path, json.dumps({'urls': self.entries}, indent=1))
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    url: str
+    body_path: Optional[Path] = None
+    changed: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def fetch(pool: ConnectionPool, cache: HttpCache, url: str, conditional: bool = True,
+          max_bytes: int = MAX_DOWNLOAD_BYTES) -> FetchResult:
+    """
+    Bring the cached copy of url up to date. changed is False when the
+    server answered 304. conditional=False always downloads the body.
+    Errors are returned, not raised.
+    """
+    response = None
+    try:
+        with span('http', url=url):
+            url_served, response = pool.get(url, cache.conditional_headers(url) if conditional else None)
+        if response.status == 304 and cache.entry(url):
+            response.read()
+            cache.revalidated(url)
+            return FetchResult(url, cache.body_path(url), changed=False)
+        if response.status != 200:
+            response.read()
+            return FetchResult(url, error=f"HTTP {response.status} {response.reason}")
+        with span('download', url=url):
+            cache.store(url, response, max_bytes)
+        return FetchResult(url, cache.body_path(url), changed=True)
+    except Exception as e:
+        if response is not None and not response.isclosed():
+            # Unread body left on a keep-alive connection; drop the connection
+            response.close()
+            pool.discard(url_served)
+        return FetchResult(url, error=str(e))
+
+
+def fetch_all(urls: Iterable[str], cache: HttpCache, workers: int = DEFAULT_WORKERS,
+              pool: Optional[ConnectionPool] = None, conditional: bool = True,
+              max_bytes: int = MAX_DOWNLOAD_BYTES) -> Iterator[FetchResult]:
+    """
+    Fetch or revalidate urls with at most `workers` requests in flight.
+    Yields results as they finish.
+    """
+    urls = list(urls)
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls) or 1))) as executor:
+            futures = [executor.submit(fetch, pool, cache, url, conditional, max_bytes) for url in urls]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        if own_pool:
+            pool.close()
+
+
+def link_or_copy(source: Path, target: Path, hardlink: bool = False) -> None:
+    """
+    Put a copy of source at target, replacing it atomically.
+    With hardlink, both names share one inode, so a later in-place write to
+    either file changes both. Every asset script replaces its outputs by
+    rename (files.atomic_writer), which gives the product a new inode and
+    leaves the cache body alone; new writers must do the same.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f'.{target.name}.link.tmp')
+    tmp.unlink(missing_ok=True)
+    try:
+        if hardlink:
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        else:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Quality-targeted JPEG encoding.
+
+Instead of a fixed quality, binary-search the lowest JPEG quality whose
+decoded result still reaches a target SSIM against the lossless render,
+for both 4:2:0 and 4:4:4 chroma subsampling, and keep the smaller file.
+The score is the lowest SSIM of the Y, Cb and Cr planes, so chroma loss
+(what subsampling trades away, and what recoloring changes) counts as
+much as luma loss.
+The chosen settings are cached by a hash of the input pixels, so later
+runs encode once without searching.
+"""
+
+import hashlib
+import io
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .cache import CACHE_DIR, cache_key
+from .files import atomic_write_text
+
+DEFAULT_TARGET_SSIM = 0.99
+MIN_QUALITY = 40
+MAX_QUALITY = 95
+
+# Pillow subsampling values: 0 = 4:4:4, 2 = 4:2:0
+SUBSAMPLINGS = (2, 0)
+
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# Bump whenever the search or the SSIM metric changes
+SEARCH_VERSION = 2
+SEARCH_CACHE_DIR = CACHE_DIR / 'jpeg-search'
+
+
+def luma(image: Image.Image) -> np.ndarray:
+    """BT.601 luma plane as float64."""
+    rgb = np.asarray(image.convert('RGB'), dtype=np.float64)
+    return rgb @ np.array([0.299, 0.587, 0.114])
+
+
+def ycbcr_planes(image: Image.Image) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Y, Cb and Cr planes as float64, in the JPEG (BT.601 full range) color space."""
+    planes = np.asarray(image.convert('RGB').convert('YCbCr'), dtype=np.float64)
+    return planes[..., 0], planes[..., 1], planes[..., 2]
+
+
+def _box_mean(plane: np.ndarray, size: int) -> np.ndarray:
+    """Mean over every size x size window ('valid' region) via an integral image."""
+    integral = np.pad(plane, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    total = (integral[size:, size:] - integral[:-size, size:]
+             - integral[size:, :-size] + integral[:-size, :-size])
+    return total / (size * size)
+
+
+def ssim(reference: np.ndarray, distorted: np.ndarray, window: int = SSIM_WINDOW) -> float:
+    """Mean SSIM of two luma planes using uniform windows."""
+    mu_x = _box_mean(reference, window)
+    mu_y = _box_mean(distorted, window)
+    var_x = _box_mean(reference * reference, window) - mu_x * mu_x
+    var_y = _box_mean(distorted * distorted, window) - mu_y * mu_y
+    cov = _box_mean(reference * distorted, window) - mu_x * mu_y
+
+    # Sample (not population) statistics, as in the usual SSIM definition
+    n = window * window
+    var_x, var_y, cov = var_x * n / (n - 1), var_y * n / (n - 1), cov * n / (n - 1)
+
+    numerator = (2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)
+    denominator = (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    return float((numerator / denominator).mean())
+
+
+def ssim_ycbcr(reference: Tuple[np.ndarray, ...], distorted: Tuple[np.ndarray, ...]) -> float:
+    """Lowest per-plane SSIM of two ycbcr_planes() results."""
+    return min(ssim(ref, dist) for ref, dist in zip(reference, distorted))
+
+
+@dataclass(frozen=True)
+class JpegSettings:
+    quality: int
+    subsampling: int
+    progressive: bool = True
+    optimize: bool = True
+
+    def save_kwargs(self) -> dict:
+        return {'quality': self.quality, 'subsampling': self.subsampling,
+                'progressive': self.progressive, 'optimize': self.optimize}
+
+
+def encode_jpeg(image: Image.Image, settings: JpegSettings) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', **settings.save_kwargs())
+    return buffer.getvalue()
+
+
+def _search_subsampling(image: Image.Image, reference: Tuple[np.ndarray, ...], target: float, subsampling: int,
+                        progressive: bool, min_quality: int, max_quality: int) -> Tuple[JpegSettings, bytes, float]:
+    """Lowest quality meeting target for one subsampling mode (or max_quality if none does)."""
+    best = None
+    low, high = min_quality, max_quality
+    while low <= high:
+        quality = (low + high) // 2
+        settings = JpegSettings(quality, subsampling, progressive)
+        data = encode_jpeg(image, settings)
+        with Image.open(io.BytesIO(data)) as decoded:
+            score = ssim_ycbcr(reference, ycbcr_planes(decoded))
+        if score >= target:
+            best = (settings, data, score)
+            high = quality - 1
+        else:
+            low = quality + 1
+
+    if best is None:
+        settings = JpegSettings(max_quality, subsampling, progressive)
+        data = encode_jpeg(image, settings)
+        with Image.open(io.BytesIO(data)) as decoded:
+            best = (settings, data, ssim_ycbcr(reference, ycbcr_planes(decoded)))
+    return best
+
+
+def search_jpeg(image: Image.Image, target: float = DEFAULT_TARGET_SSIM, progressive: bool = True,
+                min_quality: int = MIN_QUALITY, max_quality: int = MAX_QUALITY) -> Tuple[JpegSettings, bytes, float]:
+    """
+    Smallest JPEG of image whose SSIM against it, on every Y/Cb/Cr plane,
+    is at least target. Returns (settings, bytes, ssim). If no setting reaches target, the
+    highest-scoring candidate at max_quality is returned.
+    """
+    image = image.convert('RGB')
+    reference = ycbcr_planes(image)
+    candidates = [
+        _search_subsampling(image, reference, target, subsampling, progressive, min_quality, max_quality)
+        for subsampling in SUBSAMPLINGS
+    ]
+    passing = [candidate for candidate in candidates if candidate[2] >= target]
+    if passing:
+        return min(passing, key=lambda candidate: len(candidate[1]))
+    return max(candidates, key=lambda candidate: candidate[2])
+
+
+def pixel_digest(image: Image.Image) -> str:
+    """SHA-256 of an image's mode, size and pixels."""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode('ascii'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _search_path(key: str) -> Path:
+    return SEARCH_CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def targeted_jpeg(image: Image.Image, target: float = DEFAULT_TARGET_SSIM,
+                  progressive: bool = True) -> Tuple[bytes, JpegSettings, Optional[float]]:
+    """
+    Encode image at the cheapest settings that reach target SSIM.
+    Settings found earlier for the same pixels and target are reused from
+    the on-disk search cache (ssim is None then). One small file per key,
+    so parallel workers never contend on a shared index.
+    """
+    image = image.convert('RGB')
+    key = cache_key(SEARCH_VERSION, pixel_digest(image), target, progressive, MIN_QUALITY, MAX_QUALITY)
+    path = _search_path(key)
+
+    if path.exists():
+        try:
+            settings = JpegSettings(**json.loads(path.read_text(encoding='utf-8')))
+            return encode_jpeg(image, settings), settings, None
+        except (OSError, ValueError, TypeError):
+            pass
+
+    settings, data, score = search_jpeg(image, target, progressive)
+    atomic_write_text(path, json.dumps(asdict(settings)))
+    return data, settings, score
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Atomic file writes.
+Data goes to a temp file in the target directory and is renamed over the
+target, so a crash never leaves a half-written output behind.
+"""
+
+import os
+import secrets
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+
+@contextmanager
+def atomic_writer(path: Path) -> Iterator[BinaryIO]:
+    """
+    Open a temp file next to path for binary writing; it replaces path
+    when the block exits cleanly and is deleted if the block raises.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Not mkstemp: that creates 0600 files, outputs should get the usual umask
+    tmp = path.with_name(f'.{path.name}.{secrets.token_hex(4)}.tmp')
+    try:
+        with open(tmp, 'xb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write data to path via a temp file and rename."""
+    with atomic_writer(path) as f:
+        f.write(data)
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = 'utf-8') -> None:
+    """Write text to path via a temp file and rename."""
+    atomic_write_bytes(path, text.encode(encoding))
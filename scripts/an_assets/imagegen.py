@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent image generation against the Gemini/Imagen API.
+
+Requests run as asyncio tasks behind a concurrency limit and a
+requests-per-minute token bucket. 429 responses pause the bucket and halve
+its rate; successes ramp it back up. Other errors are classified:
+transient ones (timeouts, dropped connections, 5xx) are retried with
+per-request exponential backoff, permanent ones (bad request, auth, safety
+filter) fail at once. Images are written atomically as they arrive, and
+each status change can be appended to a JobJournal so a later run resumes.
+
+The client only needs `client.aio.models.generate_images(...)` (async) or
+`client.models.generate_images(...)` (sync, run in a thread), so a local
+fake can stand in for genai.Client.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, List, Optional
+
+from .cache import cache_key
+from .files import atomic_write_bytes
+from .journal import DONE, FAILED, RUNNING, JobJournal
+from .trace import span
+
+DEFAULT_RPM = 30
+DEFAULT_CONCURRENCY = 4
+MAX_ATTEMPTS = 4
+
+# Error classes
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+TRANSIENT_STATUSES = ('UNAVAILABLE', 'INTERNAL', 'DEADLINE_EXCEEDED', 'ABORTED')
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limiter.
+    throttle() after a 429 pauses all callers and halves the rate;
+    relax() after a success restores it step by step.
+    """
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self, delay: float) -> None:
+        """Back off after a rate-limit response."""
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + delay)
+
+    def relax(self) -> None:
+        """Step the rate back toward the configured maximum."""
+        self._refill(time.monotonic())
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 8)
+
+
+@dataclass(frozen=True)
+class ImageRequest:
+    code: str
+    prompt: str
+    output_path: Path
+
+
+@dataclass(frozen=True)
+class ImageResult:
+    request: ImageRequest
+    error: Optional[str] = None
+    attempts: int = 1
+    error_class: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED errors from the API."""
+    for attr in ('code', 'status_code', 'status'):
+        if getattr(error, attr, None) in (429, 'RESOURCE_EXHAUSTED'):
+            return True
+    return '429' in str(error) or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for attr in ('code', 'status_code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def classify_error(error: Exception) -> str:
+    """RATE_LIMITED, TRANSIENT (worth retrying) or PERMANENT."""
+    if is_rate_limited(error):
+        return RATE_LIMITED
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return TRANSIENT
+    name = type(error).__name__
+    if 'Timeout' in name or 'Connect' in name:
+        # httpx / aiohttp transport errors
+        return TRANSIENT
+    code = _status_code(error)
+    if code is not None:
+        return TRANSIENT if code >= 500 or code == 408 else PERMANENT
+    if getattr(error, 'status', None) in TRANSIENT_STATUSES:
+        return TRANSIENT
+    return PERMANENT
+
+
+def prompt_digest(prompt: str) -> str:
+    """Short hash of a prompt, stored in the journal to detect prompt changes."""
+    return cache_key(prompt)[:16]
+
+
+def image_bytes(response: Any) -> Optional[bytes]:
+    """Bytes of the first generated image in an Imagen response, if any."""
+    images = getattr(response, 'generated_images', None)
+    if images:
+        image = getattr(images[0], 'image', None)
+        return getattr(image, 'image_bytes', None)
+    return None
+
+
+async def _call(client: Any, model: str, prompt: str, config: Any) -> Any:
+    aio = getattr(client, 'aio', None)
+    if aio is not None:
+        return await aio.models.generate_images(model=model, prompt=prompt, config=config)
+    return await asyncio.to_thread(client.models.generate_images, model=model, prompt=prompt, config=config)
+
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential delay with +-20% jitter."""
+    return min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+
+
+async def _generate_one(client: Any, request: ImageRequest, model: str, config: Any,
+                        bucket: TokenBucket, semaphore: asyncio.Semaphore, max_attempts: int,
+                        journal: Optional[JobJournal] = None) -> ImageResult:
+    def finish(error: Optional[str] = None, error_class: Optional[str] = None) -> ImageResult:
+        if journal is not None:
+            if error is None:
+                journal.mark(request.code, DONE, attempts=attempt, prompt=prompt_digest(request.prompt))
+            else:
+                journal.mark(request.code, FAILED, attempts=attempt, error=error, error_class=error_class,
+                             prompt=prompt_digest(request.prompt))
+        return ImageResult(request, error, attempt, error_class)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        if journal is not None:
+            journal.mark(request.code, RUNNING, attempts=attempt, prompt=prompt_digest(request.prompt))
+
+        retry = False
+        async with semaphore:
+            await bucket.acquire()
+            try:
+                # One trace row per request, since requests overlap on the event loop thread
+                with span('api', lane=id(request), code=request.code, attempt=attempt):
+                    response = await _call(client, model, request.prompt, config)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == PERMANENT or attempt >= max_attempts:
+                    return finish(str(e), kind)
+                if kind == RATE_LIMITED:
+                    # Pause shared by every task via the bucket
+                    bucket.throttle(_backoff(attempt, 5.0, 60.0))
+                    continue
+                retry = True
+
+        if retry:
+            # Transient error: back off this request only, outside the semaphore
+            await asyncio.sleep(_backoff(attempt, 2.0, 30.0))
+            continue
+
+        bucket.relax()
+        data = image_bytes(response)
+        if not data:
+            # Imagen returns no image when the safety filter blocks a prompt
+            return finish("No image in response", PERMANENT)
+
+        with span('write', lane=id(request), code=request.code):
+            await asyncio.to_thread(atomic_write_bytes, request.output_path, data)
+        return finish()
+
+
+async def generate_all(client: Any, requests: List[ImageRequest], model: str, config: Any,
+                       concurrency: int = DEFAULT_CONCURRENCY, rpm: float = DEFAULT_RPM,
+                       max_attempts: int = MAX_ATTEMPTS,
+                       journal: Optional[JobJournal] = None) -> AsyncIterator[ImageResult]:
+    """
+    Generate every request and yield results in completion order.
+    With a journal, each attempt and outcome is appended to it.
+    """
+    bucket = TokenBucket(rpm)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.create_task(_generate_one(client, request, model, config, bucket, semaphore, max_attempts, journal))
+        for request in requests
+    ]
+    for task in asyncio.as_completed(tasks):
+        yield await task
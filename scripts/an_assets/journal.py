@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent job journal for long batch runs.
+
+Every status change is appended to a JSONL file as one line:
+    {"code": ..., "status": "running" | "done" | "failed", "time": ..., ...}
+The last line for a code wins when the journal is replayed, so an
+interrupted run can tell finished, failed and in-flight jobs apart.
+A torn last line from a crash is ignored.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .files import atomic_write_text
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobJournal:
+    """Append-only JSONL journal of job status by code."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.jobs[record['code']] = record
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(code)
+
+    def status(self, code: str) -> Optional[str]:
+        record = self.jobs.get(code)
+        return record['status'] if record else None
+
+    def mark(self, code: str, status: str, **fields: Any) -> None:
+        """Append a status change and flush it to disk."""
+        record = {'code': code, 'status': status, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+        record.update(fields)
+        self.jobs[code] = record
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the latest record per code."""
+        atomic_write_text(self.path, ''.join(
+            json.dumps(record, ensure_ascii=False) + '\n' for record in self.jobs.values()
+        ))
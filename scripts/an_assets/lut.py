@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup-table recoloring.
+The recolor transform depends only on the source color, so it can be
+computed once per 3D LUT cell and applied to a whole image with one gather.
+LUTs can be exported as .cube files for use in other tools.
+"""
+
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+from .recolor import RecolorProfile, recolor_array
+
+DEFAULT_LUT_SIZE = 33
+# A size^3 table is recolored in one float64 pass: 64 is ~260k colors and a
+# few tens of MB of temporaries, 256 would be 16.7M colors and several GB
+MAX_LUT_SIZE = 64
+
+
+def lut_grid(size: int) -> np.ndarray:
+    """Source colors at the LUT cell centers as uint8 values, shape (size,)."""
+    return np.round(np.linspace(0, 255, size)).astype(np.uint8)
+
+
+def build_lut(target_rgb: Tuple[int, int, int], profile: RecolorProfile,
+              size: int = DEFAULT_LUT_SIZE) -> np.ndarray:
+    """
+    Recolor every grid color and return a (size, size, size, 3) uint8 LUT
+    indexed as lut[r, g, b]. size must be 2..MAX_LUT_SIZE; the LUT is an
+    approximation at any size, use the full recolor for exact output.
+    """
+    if not 2 <= size <= MAX_LUT_SIZE:
+        raise ValueError(f"LUT size must be between 2 and {MAX_LUT_SIZE}, got {size}")
+    grid = lut_grid(size)
+    r, g, b = np.meshgrid(grid, grid, grid, indexing='ij')
+    colors = np.stack([r, g, b], axis=-1)
+    return recolor_array(colors, target_rgb, profile)
+
+
+def apply_lut(rgb: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """
+    Apply a LUT to a uint8 (H, W, 3) array using the nearest cell.
+
+    The cell's color shift is added to the pixel rather than replacing it,
+    so pixels in cells the transform leaves alone come out unchanged.
+    """
+    size = lut.shape[0]
+    grid = lut_grid(size).astype(np.int16)
+    cells = (rgb.astype(np.int32) * (size - 1) + 127) // 255
+    ri, gi, bi = cells[..., 0], cells[..., 1], cells[..., 2]
+
+    shift = lut[ri, gi, bi].astype(np.int16) - np.stack([grid[ri], grid[gi], grid[bi]], axis=-1)
+    return np.clip(rgb.astype(np.int16) + shift, 0, 255).astype(np.uint8)
+
+
+def write_cube(path: Path, lut: np.ndarray, title: str = '') -> None:
+    """Write a LUT in the Adobe/Resolve .cube format (red varies fastest)."""
+    size = lut.shape[0]
+    rows = lut.transpose(2, 1, 0, 3).reshape(-1, 3) / 255.0
+
+    lines = []
+    if title:
+        lines.append(f'TITLE "{title}"')
+    lines.append(f'LUT_3D_SIZE {size}')
+    lines.append('DOMAIN_MIN 0.0 0.0 0.0')
+    lines.append('DOMAIN_MAX 1.0 1.0 1.0')
+    lines.extend(f'{r:.6f} {g:.6f} {b:.6f}' for r, g, b in rows)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
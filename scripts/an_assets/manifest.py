@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental build manifest for generated image folders.
+
+Each output directory (public/images/products, public/images/menu-extracted)
+has a manifest recording, per output file: the script that built it, its
+input files and their hashes, a hash of the build parameters, the output's
+own hash and size, and the build time. Scripts consult it to rebuild only
+stale outputs.
+
+Manifests are build state, so they live under .cache/an-assets/manifests/
+mirroring the output path, not next to the outputs where public/ would
+serve them. A .manifest.json left in an output directory by older versions
+is read once and removed on the next save.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .cache import CACHE_DIR, cache_key, file_digest
+
+MANIFEST_DIR = CACHE_DIR / 'manifests'
+MANIFEST_NAME = 'manifest.json'
+LEGACY_MANIFEST_NAME = '.manifest.json'
+REPO_ROOT = Path(__file__).parent.parent.parent
+
+
+def _relative(path: Path) -> str:
+    """Repo-relative posix path, or the absolute path for files outside the repo."""
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(REPO_ROOT.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def manifest_path(directory: Path) -> Path:
+    """Where the manifest of an output directory is kept."""
+    relative = _relative(directory)
+    if Path(relative).is_absolute():
+        # Outside the repo (e.g. a benchmark work dir): key by the absolute path
+        return MANIFEST_DIR / 'external' / cache_key(relative)[:16] / MANIFEST_NAME
+    return MANIFEST_DIR / relative / MANIFEST_NAME
+
+
+class Manifest:
+    """The manifest of one output directory."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.path = manifest_path(self.directory)
+        self.legacy_path = self.directory / LEGACY_MANIFEST_NAME
+        self._migrate = not self.path.exists() and self.legacy_path.exists()
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self._dirty: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._digests: Dict[Path, str] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        path = self.path if self.path.exists() else self.legacy_path
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding='utf-8')).get('outputs', {})
+        except (OSError, ValueError):
+            # A corrupt manifest only costs a rebuild
+            return {}
+
+    def digest(self, path: Path) -> str:
+        """SHA-256 of an input file, computed once per run."""
+        path = Path(path).resolve()
+        if path not in self._digests:
+            self._digests[path] = file_digest(path)
+        return self._digests[path]
+
+    def inputs(self, paths: Iterable[Path]) -> Dict[str, str]:
+        """{repo-relative path: sha256} for a set of input files."""
+        return {_relative(path): self.digest(path) for path in paths}
+
+    def entry(self, output_path: Path) -> Optional[Dict[str, Any]]:
+        return self.entries.get(Path(output_path).name)
+
+    def owned_by(self, output_path: Path, builder: str) -> bool:
+        """True if output_path was last built by builder."""
+        entry = self.entry(output_path)
+        return entry is not None and entry.get('builder') == builder
+
+    def is_fresh(self, output_path: Path, builder: str, params: str,
+                 inputs: Optional[Iterable[Path]] = None) -> bool:
+        """
+        True if output_path exists unchanged and was built by builder from
+        the same parameters and the same input file contents.
+        """
+        output_path = Path(output_path)
+        entry = self.entry(output_path)
+        if not entry or entry.get('builder') != builder or entry.get('params') != params:
+            return False
+        if entry.get('inputs', {}) != self.inputs(inputs or []):
+            return False
+        if not output_path.exists() or output_path.stat().st_size != entry.get('size'):
+            return False
+        return file_digest(output_path) == entry.get('sha256')
+
+    def record(self, output_path: Path, builder: str, params: str,
+               inputs: Optional[Iterable[Path]] = None, **extra: Any) -> None:
+        """Record a freshly built output."""
+        output_path = Path(output_path)
+        entry = {
+            'builder': builder,
+            'inputs': self.inputs(inputs or []),
+            'params': params,
+            'sha256': file_digest(output_path),
+            'size': output_path.stat().st_size,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        entry.update(extra)
+        self.entries[output_path.name] = entry
+        self._dirty[output_path.name] = entry
+
+    def forget(self, output_path: Path) -> None:
+        """Drop the entry for an output that was removed."""
+        name = Path(output_path).name
+        self.entries.pop(name, None)
+        self._dirty[name] = None
+
+    def save(self) -> None:
+        """
+        Write changed entries back. The file is re-read first so scripts that
+        share a directory do not drop each other's entries.
+        """
+        if not self._dirty and not self._migrate:
+            return
+
+        entries = self._load()
+        for name, entry in self._dirty.items():
+            if entry is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = entry
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'outputs': dict(sorted(entries.items()))}, indent=2, ensure_ascii=False) + '\n',
+                       encoding='utf-8')
+        tmp.replace(self.path)
+        self.legacy_path.unlink(missing_ok=True)
+        self._migrate = False
+        self.entries = entries
+        self._dirty = {}
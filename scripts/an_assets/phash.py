@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Perceptual hashes and near-duplicate grouping.
+
+pHash (low-frequency DCT of a 32x32 grayscale image) and dHash (sign of
+horizontal gradients on a 9x8 grayscale image) are both 64-bit integers;
+near-identical images differ in only a few bits. A BK-tree over Hamming
+distance finds every hash within a radius without comparing all pairs.
+
+Both hashes are grayscale, and every recolored product shares the same
+cup template, so candidate pairs must also match a 4x4 color thumbnail.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+from PIL import Image
+
+T = TypeVar('T')
+
+# Mean absolute difference (0-255) allowed between 4x4 color thumbnails;
+# recolors of different drinks on the shared template start around 1.5
+COLOR_TOLERANCE = 1.0
+
+
+def _load(path: Path, mode: str, size: Tuple[int, int]) -> Image.Image:
+    with Image.open(path) as image:
+        # Hash inputs are tiny; decode JPEGs at reduced DCT scale
+        image.draft(mode, (size[0] * 4, size[1] * 4))
+        image = image.convert(mode)
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def _gray(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    return np.asarray(image.convert('L').resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis as an n x n matrix."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """64-bit DCT perceptual hash."""
+    pixels = _gray(image, (32, 32))
+    dct = _DCT32 @ pixels @ _DCT32.T
+    low = dct[:8, :8].ravel()
+    # Compare against the median of the AC terms; DC only shifts brightness
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash."""
+    pixels = _gray(image, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+@dataclass(frozen=True)
+class ImageHash:
+    phash: int
+    dhash: int
+    # 4x4 RGB thumbnail, 48 bytes
+    colors: bytes
+
+    def color_distance(self, other: 'ImageHash') -> float:
+        a = np.frombuffer(self.colors, np.uint8).astype(np.int16)
+        b = np.frombuffer(other.colors, np.uint8).astype(np.int16)
+        return float(np.abs(a - b).mean())
+
+
+def image_hash(path: Path) -> ImageHash:
+    """pHash, dHash and color thumbnail of an image file, from one reduced decode."""
+    image = _load(path, 'RGB', (32, 32))
+    colors = image.resize((4, 4), Image.Resampling.BOX).tobytes()
+    return ImageHash(phash(image), dhash(image), colors)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree(Generic[T]):
+    """Burkhard-Keller tree of (hash, item) pairs under Hamming distance."""
+
+    def __init__(self):
+        # Node: [hash, items, {distance: child node}]
+        self.root: Optional[List[Any]] = None
+
+    def add(self, key: int, item: T) -> None:
+        if self.root is None:
+            self.root = [key, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [item], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, T]]:
+        """Every (distance, item) within radius of key."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def near_duplicate_groups(hashes: Dict[T, ImageHash], threshold: int,
+                          color_tolerance: float = COLOR_TOLERANCE) -> List[List[T]]:
+    """
+    Group items whose pHash and dHash are both within threshold bits and
+    whose colors match within color_tolerance. Each group is built around
+    its first item in iteration order and every member must be close to
+    that item, so small differences never chain into one large group.
+    Singletons are omitted.
+    """
+    tree: BKTree[T] = BKTree()
+    for item, h in hashes.items():
+        tree.add(h.phash, item)
+
+    assigned = set()
+    groups = []
+    for leader, h in hashes.items():
+        if leader in assigned:
+            continue
+        assigned.add(leader)
+        group = [leader]
+        for _, other in sorted(tree.search(h.phash, threshold), key=lambda hit: hit[0]):
+            if (other not in assigned and hamming(h.dhash, hashes[other].dhash) <= threshold
+                    and h.color_distance(hashes[other]) <= color_tolerance):
+                assigned.add(other)
+                group.append(other)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
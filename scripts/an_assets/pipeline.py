@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+The asset scripts as one build graph.
+
+Each Stage wraps one script in scripts/ and declares the files it reads and
+writes as repo-relative globs. A stage depends on every stage whose outputs
+it reads. Stages that write the same files run one after another, in
+declaration order. Everything else runs concurrently.
+
+A stage is skipped without starting its script when its inputs, its code
+and its arguments hash to the same stamp as the last successful run, and
+its outputs are unchanged since then. Stamps are kept in
+.cache/an-assets/pipeline.json. Inside a stage, the script's own manifest
+still skips the products that are up to date.
+"""
+
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .cache import CACHE_DIR, cache_key, file_digest
+from .files import atomic_write_text
+from .trace import span
+
+REPO_ROOT = Path(__file__).parent.parent.parent
+SCRIPTS_DIR = Path(__file__).parent.parent
+STATE_PATH = CACHE_DIR / 'pipeline.json'
+
+CATALOG = 'scripts/an_assets/catalog.json'
+PRODUCT_IMAGES = 'public/images/products/*.jpg'
+MENU_IMAGES = 'public/images/menu-extracted/*.jpg'
+
+# Stage outcomes
+OK = 'ok'
+PARTIAL = 'partial'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+BLOCKED = 'blocked'
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    script: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    # Accepts --only PATTERN product selectors
+    selectable: bool = False
+    # Part of a plain `build`; network and paid-API stages, and stages whose
+    # output nothing ships, must be named explicitly
+    default: bool = True
+    # Catalog method selecting the products the script builds, e.g. 'with_cup'
+    products: Optional[str] = None
+
+
+STAGES: Tuple[Stage, ...] = (
+    Stage('download', 'download-stock-images.py', (CATALOG,), (PRODUCT_IMAGES,),
+          selectable=True, default=False, products='with_stock'),
+    Stage('generate', 'generate-product-images.py', (CATALOG,), (PRODUCT_IMAGES,),
+          selectable=True, default=False, products='with_prompt'),
+    # The menu shows paper cup images. recolor-drink-images.py renders the
+    # same products into the same files and keeps images another script
+    # built, so after this stage it would skip every product. It is left out
+    # of the graph and run by hand (with --force) to try the drink templates.
+    Stage('recolor-cup', 'recolor-paper-cup.py', (CATALOG, 'public/images/paper-cup-an.jpg'), (PRODUCT_IMAGES,),
+          selectable=True, products='with_cup'),
+    Stage('extract', 'extract-menu-images.py', ('public/images/menu-an.jpg',), (MENU_IMAGES,),
+          selectable=True),
+    Stage('variants', 'generate-image-variants.py', (PRODUCT_IMAGES,),
+          ('public/images/products/variants/*', 'src/lib/data/product-image-variants.json'), selectable=True),
+    Stage('placeholders', 'generate-placeholders.py', (PRODUCT_IMAGES, MENU_IMAGES),
+          ('src/lib/data/product-placeholders.json',)),
+    Stage('atlas', 'build-sprite-atlas.py', (PRODUCT_IMAGES,), ('.cache/an-assets/atlas/*',),
+          default=False),
+    Stage('dedupe', 'dedupe-images.py', (PRODUCT_IMAGES, MENU_IMAGES, 'src/lib/data/product-images.ts'),
+          ('src/lib/data/product-image-aliases.json',)),
+)
+
+
+def dependencies(stages: Sequence[Stage]) -> Dict[str, Set[str]]:
+    """{stage: stages that must finish first}, among the given stages only."""
+    deps: Dict[str, Set[str]] = {stage.name: set() for stage in stages}
+    for i, stage in enumerate(stages):
+        for j, other in enumerate(stages):
+            if i == j:
+                continue
+            # Reads what the other stage writes
+            if set(stage.inputs) & set(other.outputs):
+                deps[stage.name].add(other.name)
+            # Writes the same files: keep declaration order
+            elif j < i and set(stage.outputs) & set(other.outputs):
+                deps[stage.name].add(other.name)
+    return deps
+
+
+def topological(stages: Sequence[Stage]) -> List[Stage]:
+    """Stages in an order where every stage follows its dependencies."""
+    deps = dependencies(stages)
+    done: Set[str] = set()
+    order: List[Stage] = []
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if deps[stage.name] <= done]
+        if not ready:
+            raise ValueError(f"Cycle between stages: {', '.join(s.name for s in remaining)}")
+        for stage in ready:
+            order.append(stage)
+            done.add(stage.name)
+            remaining.remove(stage)
+    return order
+
+
+def _expand(patterns: Sequence[str]) -> List[Path]:
+    paths = set()
+    for pattern in patterns:
+        for match in glob.glob(str(REPO_ROOT / pattern)):
+            path = Path(match)
+            if path.is_file() and not path.name.startswith('.'):
+                paths.add(path)
+    return sorted(paths)
+
+
+@dataclass
+class StageRun:
+    stage: Stage
+    status: str
+    seconds: float = 0.0
+    output: str = ''
+
+
+@dataclass
+class Pipeline:
+    stages: Sequence[Stage] = STAGES
+    only: Optional[Sequence[str]] = None
+    force: bool = False
+    state_path: Path = STATE_PATH
+    state: Dict[str, dict] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        # (path, size, mtime_ns) -> sha256, so files shared by stages are hashed once
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        if not self.state and self.state_path.exists():
+            try:
+                self.state = json.loads(self.state_path.read_text(encoding='utf-8')).get('stages', {})
+            except (OSError, ValueError):
+                self.state = {}
+
+    def _digest(self, path: Path) -> str:
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._digests.get(key)
+        if cached is None:
+            cached = file_digest(path)
+            with self._lock:
+                self._digests[key] = cached
+        return cached
+
+    def _files(self, patterns: Sequence[str]) -> Dict[str, str]:
+        return {path.relative_to(REPO_ROOT).as_posix(): self._digest(path) for path in _expand(patterns)}
+
+    def arguments(self, stage: Stage) -> List[str]:
+        args: List[str] = []
+        if stage.selectable:
+            for pattern in self.only or ():
+                args += ['--only', pattern]
+        return args
+
+    def stamp(self, stage: Stage) -> str:
+        """Hash of the stage's inputs, code and arguments."""
+        code = [SCRIPTS_DIR / stage.script] + sorted((SCRIPTS_DIR / 'an_assets').glob('*.py'))
+        return cache_key(stage.name, self.arguments(stage), self._files(stage.inputs),
+                         [self._digest(path) for path in code])
+
+    def is_fresh(self, stage: Stage, stamp: str) -> bool:
+        previous = self.state.get(stage.name)
+        return (not self.force and previous is not None and previous.get('stamp') == stamp
+                and previous.get('outputs') == cache_key(self._files(stage.outputs)))
+
+    def _record(self, stage: Stage, stamp: str) -> None:
+        entry = {'stamp': stamp, 'outputs': cache_key(self._files(stage.outputs)), 'built': time.time()}
+        with self._lock:
+            self.state[stage.name] = entry
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(self.state_path, json.dumps({'stages': self.state}, indent=2, sort_keys=True) + '\n')
+
+    def run_stage(self, stage: Stage) -> StageRun:
+        """Run one stage's script unless its stamp is current."""
+        started = time.perf_counter()
+        stamp = self.stamp(stage)
+        if self.is_fresh(stage, stamp):
+            return StageRun(stage, SKIPPED, time.perf_counter() - started)
+
+        env = dict(os.environ, PYTHONIOENCODING='utf-8')
+        with span('stage', lane=self.stages.index(stage), stage=stage.name):
+            process = subprocess.run([sys.executable, str(SCRIPTS_DIR / stage.script)] + self.arguments(stage),
+                                     cwd=SCRIPTS_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     encoding='utf-8', errors='replace')
+        seconds = time.perf_counter() - started
+        if process.returncode != 0:
+            return StageRun(stage, FAILED, seconds, process.stdout)
+        if re.search(r'^Failed: [1-9]', process.stdout, re.M):
+            # Some products failed; don't stamp, so the next build retries them
+            return StageRun(stage, PARTIAL, seconds, process.stdout)
+        self._record(stage, stamp)
+        return StageRun(stage, OK, seconds, process.stdout)
+
+    def run(self, workers: int = 2, report: Optional[Callable[[StageRun], None]] = None) -> List[StageRun]:
+        """
+        Run the stages as a DAG: a stage starts once every dependency has
+        finished, and up to `workers` stages run at once. Dependents of a
+        failed stage are not run.
+        """
+        deps = dependencies(self.stages)
+        topological(self.stages)
+        pending = list(self.stages)
+        finished: Dict[str, StageRun] = {}
+        results: List[StageRun] = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            running = {}
+            while pending or running:
+                for stage in list(pending):
+                    if not deps[stage.name] <= set(finished):
+                        continue
+                    pending.remove(stage)
+                    if any(finished[dep].status in (FAILED, BLOCKED) for dep in deps[stage.name]):
+                        result = StageRun(stage, BLOCKED)
+                        finished[stage.name] = result
+                        results.append(result)
+                        if report:
+                            report(result)
+                        continue
+                    running[pool.submit(self.run_stage, stage)] = stage
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = StageRun(stage, FAILED, output=f"{type(e).__name__}: {e}\n")
+                    finished[stage.name] = result
+                    results.append(result)
+                    if report:
+                        report(result)
+        return results
+
+
+def select_stages(names: Sequence[str], stages: Sequence[Stage] = STAGES) -> List[Stage]:
+    """Named stages, or every default stage if none are named. Raises KeyError on unknown names."""
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise KeyError(', '.join(unknown))
+    if not names:
+        return [stage for stage in stages if stage.default]
+    return [stage for stage in stages if stage.name in names]
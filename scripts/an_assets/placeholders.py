@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Low-quality image placeholders (LQIP) and dominant colors.
+
+JPEGs are opened in DCT draft mode at 1/8 scale, so a 600px product image
+decodes as ~75px and the placeholder costs a fraction of a full decode.
+"""
+
+import base64
+import io
+from pathlib import Path
+from typing import Tuple
+
+from PIL import Image, features
+
+PLACEHOLDER_SIZE = 16
+
+# Near-white pixels are studio background, not the product's color
+BACKGROUND_LIGHTNESS = 235
+
+
+def _small(path: Path, size: int) -> Image.Image:
+    """Decode path at roughly size..8*size pixels and return it as RGB."""
+    with Image.open(path) as image:
+        image.draft('RGB', (size * 4, size * 4))
+        image = image.convert('RGB')
+    image.thumbnail((size * 4, size * 4), Image.Resampling.BOX)
+    return image
+
+
+def data_uri(image: Image.Image) -> str:
+    """Tiny image encoded as a WebP (or PNG) data URI."""
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        image.save(buffer, 'WEBP', quality=60, method=6)
+        mime = 'image/webp'
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+        mime = 'image/png'
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+def dominant_color(image: Image.Image, colors: int = 5) -> str:
+    """Most common non-background color as #rrggbb (median-cut palette)."""
+    quantized = image.quantize(colors, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()[:colors * 3]
+    counts = sorted(quantized.getcolors(), reverse=True)
+
+    def rgb(index: int) -> Tuple[int, int, int]:
+        return tuple(palette[index * 3:index * 3 + 3])
+
+    foreground = [(count, index) for count, index in counts if min(rgb(index)) < BACKGROUND_LIGHTNESS]
+    _, index = (foreground or counts)[0]
+    return '#%02x%02x%02x' % rgb(index)
+
+
+def placeholder(path: Path, size: int = PLACEHOLDER_SIZE) -> Tuple[str, str, Tuple[int, int]]:
+    """(blur data URI, dominant #rrggbb, original (width, height)) for an image file."""
+    with Image.open(path) as image:
+        original_size = image.size
+    small = _small(path, size)
+    color = dominant_color(small)
+    small.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return data_uri(small), color, original_size
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runner for recolor jobs, serial or across a process pool.
+Prepared templates are placed in shared memory once; workers attach to
+them by name instead of receiving a pickled copy with every task.
+Templates loaded from the template cache skip the copy: workers map the
+same .npy files and share their pages through the OS page cache.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field, replace
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .cache import cache_key
+from .encode import targeted_jpeg
+from .files import atomic_write_bytes, atomic_writer
+from . import trace
+from .lut import apply_lut, build_lut, write_cube, DEFAULT_LUT_SIZE
+from .recolor import PreparedTemplate, RecolorProfile
+from .templates import map_template
+from .trace import span
+
+JPEG_QUALITY = 92
+
+# Bump whenever render_job() output changes for the same inputs
+RENDER_VERSION = 1
+
+
+@dataclass(frozen=True)
+class RecolorJob:
+    """One product to render from a named template."""
+    code: str
+    name: str
+    template: str
+    target_rgb: Tuple[int, int, int]
+    output_path: Path
+    resize: Optional[Tuple[int, int]] = None
+    lut_size: Optional[int] = None
+    cube_dir: Optional[Path] = None
+    # Search JPEG settings for this SSIM instead of using JPEG_QUALITY
+    target_ssim: Optional[float] = None
+    # The template was already prescaled to `resize`; recolor at output size
+    prescaled: bool = False
+
+
+@dataclass(frozen=True)
+class RecolorResult:
+    job: RecolorJob
+    error: Optional[str] = None
+    # Trace events recorded in a worker process, merged by run_jobs()
+    events: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def job_cache_key(job: RecolorJob, template_digest: str, profile: RecolorProfile) -> str:
+    """Build cache key covering everything that affects the job's output bytes."""
+    parts = [RENDER_VERSION, template_digest, asdict(profile),
+             job.target_rgb, job.resize, job.lut_size, JPEG_QUALITY]
+    if job.target_ssim:
+        # Only appended when set, so fixed-quality keys stay unchanged
+        parts.append(('ssim', job.target_ssim))
+    if job.prescaled:
+        parts.append(('prescaled', True))
+    return cache_key(*parts)
+
+
+def render_job(template: PreparedTemplate, job: RecolorJob) -> None:
+    """Recolor, resize and save one product. Raises on failure."""
+    if job.lut_size or job.cube_dir:
+        with span('lut', size=job.lut_size or DEFAULT_LUT_SIZE):
+            lut = build_lut(job.target_rgb, template.profile, job.lut_size or DEFAULT_LUT_SIZE)
+
+    if job.lut_size:
+        with span('apply_lut'):
+            image = Image.fromarray(apply_lut(template.rgb, lut), 'RGB')
+    else:
+        # Rendered in place into the template's buffer (one per process);
+        # resize and the encoder read it without another full-frame copy
+        image = template.render_frame(job.target_rgb)
+
+    if job.resize and not job.prescaled:
+        with span('resize', size=list(job.resize)):
+            image = image.resize(job.resize, Image.Resampling.LANCZOS)
+
+    # Outputs are replaced by rename, never rewritten in place: a product may
+    # be a hardlink to a download cache body (download-stock-images --hardlink)
+    with span('encode'):
+        if job.target_ssim:
+            data, _, _ = targeted_jpeg(image, job.target_ssim)
+            atomic_write_bytes(job.output_path, data)
+        else:
+            with atomic_writer(job.output_path) as f:
+                image.save(f, 'JPEG', quality=JPEG_QUALITY)
+
+    if job.cube_dir:
+        write_cube(job.cube_dir / f"{job.code}.cube", lut, title=job.name)
+
+
+def _run_job(template: PreparedTemplate, job: RecolorJob) -> RecolorResult:
+    try:
+        with span('product', code=job.code):
+            render_job(template, job)
+        return RecolorResult(job)
+    except Exception as e:
+        return RecolorResult(job, str(e))
+
+
+def default_jobs() -> int:
+    """One worker per CPU."""
+    return os.cpu_count() or 1
+
+
+# --- Shared memory ---------------------------------------------------------
+
+# Per-worker state: templates attached in the pool initializer, plus the
+# SharedMemory handles that must stay open while the arrays are in use
+_worker_templates: Dict[str, PreparedTemplate] = {}
+_worker_segments: List[shared_memory.SharedMemory] = []
+
+# {template key: (profile, {array name: (segment name, shape, dtype)} or template cache directory)}
+SharedSpec = Dict[str, Tuple[RecolorProfile, Union[str, Dict[str, Tuple[str, Tuple[int, ...], str]]]]]
+
+
+def _share_templates(templates: Dict[str, PreparedTemplate]) -> Tuple[SharedSpec, List[shared_memory.SharedMemory]]:
+    """Copy each template's arrays into shared memory segments, unless they are already mapped from files."""
+    spec: SharedSpec = {}
+    segments = []
+    for key, template in templates.items():
+        if template.cache_dir is not None:
+            spec[key] = (template.profile, str(template.cache_dir))
+            continue
+        arrays = {}
+        for name, array in template.arrays().items():
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments.append(segment)
+            np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+            arrays[name] = (segment.name, array.shape, array.dtype.str)
+        spec[key] = (template.profile, arrays)
+    return spec, segments
+
+
+def _attach_templates(spec: SharedSpec, tracing: bool = False) -> None:
+    """Pool initializer: map the shared arrays back into PreparedTemplates."""
+    if tracing:
+        trace.enable()
+    for key, (profile, arrays) in spec.items():
+        if isinstance(arrays, str):
+            _worker_templates[key] = map_template(Path(arrays), profile)
+            continue
+        views = {}
+        for name, (segment_name, shape, dtype) in arrays.items():
+            segment = shared_memory.SharedMemory(name=segment_name)
+            _worker_segments.append(segment)
+            views[name] = np.ndarray(shape, np.dtype(dtype), buffer=segment.buf)
+        _worker_templates[key] = PreparedTemplate.from_arrays(views, profile)
+
+
+def _run_shared_job(job: RecolorJob) -> RecolorResult:
+    if not trace.enabled():
+        return _run_job(_worker_templates[job.template], job)
+    with trace.capture() as events:
+        result = _run_job(_worker_templates[job.template], job)
+    return replace(result, events=events)
+
+
+# --- Runner ----------------------------------------------------------------
+
+def run_jobs(templates: Dict[str, PreparedTemplate], jobs: List[RecolorJob], workers: int = 1) -> Iterator[RecolorResult]:
+    """
+    Render jobs and yield results as they finish.
+    workers <= 1 runs in this process; otherwise a process pool is used.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _run_job(templates[job.template], job)
+        return
+
+    spec, segments = _share_templates(templates)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                 initializer=_attach_templates, initargs=(spec, trace.enabled())) as pool:
+            futures = [pool.submit(_run_shared_job, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                trace.merge(result.events)
+                yield result
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized recolor engine for the drink and paper cup templates.
+Works on whole NumPy arrays instead of walking pixels one by one.
+Output matches the colorsys-based per-pixel loop bit for bit.
+"""
+
+import colorsys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .trace import span
+
+ONE_THIRD = 1.0 / 3.0
+ONE_SIXTH = 1.0 / 6.0
+TWO_THIRD = 2.0 / 3.0
+
+
+@dataclass(frozen=True)
+class RecolorProfile:
+    """
+    Mask thresholds and blend coefficients for one template type.
+
+    A pixel is recolored when hue_min <= h <= hue_max, s > min_saturation
+    and min_lightness < l < max_lightness. Its new lightness and saturation
+    are orig * weight[0] + target * weight[1], clamped to clamp_min..clamp_max.
+    """
+    hue_min: float
+    hue_max: float
+    min_saturation: float
+    min_lightness: float
+    max_lightness: float
+    lightness_weights: Tuple[float, float]
+    saturation_weights: Tuple[float, float]
+    clamp_min: float
+    clamp_max: float
+
+
+# Milk tea: brownish/tan colors with decent saturation
+MILKTEA_PROFILE = RecolorProfile(
+    hue_min=0.02, hue_max=0.15,
+    min_saturation=0.15, min_lightness=0.20, max_lightness=0.90,
+    lightness_weights=(0.6, 0.4), saturation_weights=(0.4, 0.6),
+    clamp_min=0.1, clamp_max=0.95,
+)
+
+# Fruit tea: orange/amber colors, keeps more original brightness for transparency
+FRUITTEA_PROFILE = RecolorProfile(
+    hue_min=0.02, hue_max=0.18,
+    min_saturation=0.20, min_lightness=0.25, max_lightness=0.85,
+    lightness_weights=(0.7, 0.3), saturation_weights=(0.5, 0.5),
+    clamp_min=0.1, clamp_max=0.95,
+)
+
+# Paper cup: brown/tan cup body from paper-cup-an.jpg
+PAPER_CUP_PROFILE = RecolorProfile(
+    hue_min=0.02, hue_max=0.12,
+    min_saturation=0.15, min_lightness=0.20, max_lightness=0.85,
+    lightness_weights=(0.5, 0.5), saturation_weights=(0.3, 0.7),
+    clamp_min=0.15, clamp_max=0.90,
+)
+
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """Composite RGBA onto white, or convert any other mode to RGB."""
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def prescale(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Flatten and resize a template to the output size before recoloring, so
+    per-product work covers output pixels only. A JPEG that is not loaded
+    yet is decoded at the smallest DCT scale (1/2, 1/4, 1/8) that still
+    covers size; draft() is a no-op for other formats and loaded images.
+    """
+    image.draft('RGB', size)
+    return flatten_to_rgb(image).resize(size, Image.Resampling.LANCZOS)
+
+
+def pack_rgb(rgb: np.ndarray) -> np.ndarray:
+    """Pack uint8 (..., 3) colors into uint32 codes 0xRRGGBB."""
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def rgb_to_hls(rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convert a uint8 (..., 3) array to float64 H, L, S planes.
+    Mirrors colorsys.rgb_to_hls operation for operation.
+    """
+    rgb = rgb.astype(np.float64) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    l = sumc / 2.0
+    gray = minc == maxc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(l <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+        h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+        h = (h / 6.0) % 1.0
+
+    h[gray] = 0.0
+    s[gray] = 0.0
+    return h, l, s
+
+
+def _hue_channel(m1: np.ndarray, m2: np.ndarray, hue: float) -> np.ndarray:
+    """colorsys._v for a scalar hue and array m1/m2."""
+    hue = hue % 1.0
+    if hue < ONE_SIXTH:
+        return m1 + (m2 - m1) * hue * 6.0
+    if hue < 0.5:
+        return m2
+    if hue < TWO_THIRD:
+        return m1 + (m2 - m1) * (TWO_THIRD - hue) * 6.0
+    return m1
+
+
+def hls_to_rgb(h: float, l: np.ndarray, s: np.ndarray) -> np.ndarray:
+    """
+    Convert a single hue plus L/S arrays to a uint8 (N, 3) array.
+    Truncates like int(x * 255) in the per-pixel version.
+    """
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+
+    channels = np.stack([
+        _hue_channel(m1, m2, h + ONE_THIRD),
+        _hue_channel(m1, m2, h),
+        _hue_channel(m1, m2, h - ONE_THIRD),
+    ], axis=-1)
+
+    # s == 0 means gray: colorsys returns (l, l, l)
+    gray = s == 0.0
+    if gray.any():
+        channels[gray] = l[gray, None]
+
+    return (channels * 255).astype(np.int64).astype(np.uint8)
+
+
+def compute_mask(h: np.ndarray, l: np.ndarray, s: np.ndarray, profile: RecolorProfile) -> np.ndarray:
+    """Boolean mask of pixels that belong to the recolorable area."""
+    return (
+        (profile.hue_min <= h) & (h <= profile.hue_max)
+        & (s > profile.min_saturation)
+        & (l > profile.min_lightness)
+        & (l < profile.max_lightness)
+    )
+
+
+def blend(orig_l: np.ndarray, orig_s: np.ndarray,
+          target_rgb: Tuple[int, int, int], profile: RecolorProfile) -> np.ndarray:
+    """Blend original L/S with the target color and return new uint8 RGB rows."""
+    target_h, target_l, target_s = colorsys.rgb_to_hls(
+        target_rgb[0] / 255.0, target_rgb[1] / 255.0, target_rgb[2] / 255.0
+    )
+
+    lw_orig, lw_target = profile.lightness_weights
+    sw_orig, sw_target = profile.saturation_weights
+    new_l = orig_l * lw_orig + target_l * lw_target
+    new_s = orig_s * sw_orig + target_s * sw_target
+
+    # Same as max(clamp_min, min(clamp_max, x))
+    new_l = np.clip(new_l, profile.clamp_min, profile.clamp_max)
+    new_s = np.clip(new_s, profile.clamp_min, profile.clamp_max)
+
+    return hls_to_rgb(target_h, new_l, new_s)
+
+
+class PreparedTemplate:
+    """
+    A decoded template with its mask and masked L/S values cached.
+
+    Build it once per base image; each product then only blends the unique
+    colors of the masked area, so batch cost grows with the masked area
+    instead of the full frame.
+    """
+
+    # Everything render() needs; enough to rebuild the template without recomputing
+    ARRAYS = ('rgb', 'mask', 'indices', 'palette_index', 'palette_lightness', 'palette_saturation')
+
+    # Reusable buffers for render_frame(), created on first use: the RGBX
+    # output frame and the per-pixel colors gathered from the palette
+    _frame: Optional[np.ndarray] = None
+    _gathered: Optional[np.ndarray] = None
+
+    # Set when the arrays are memory-mapped from the template cache (templates.py)
+    cache_dir: Optional[Path] = None
+
+    def __init__(self, rgb: np.ndarray, profile: RecolorProfile):
+        self.rgb = rgb
+        self.profile = profile
+
+        with span('hls', pixels=rgb.shape[0] * rgb.shape[1]):
+            h, l, s = rgb_to_hls(rgb)
+        with span('mask'):
+            self.mask = compute_mask(h, l, s, profile)
+            self.indices = np.flatnonzero(self.mask)
+
+        # The masked area repeats far fewer colors than it has pixels, so the
+        # blend runs once per unique color and is gathered back per pixel
+        with span('palette'):
+            codes = pack_rgb(rgb.reshape(-1, 3)[self.indices])
+            _, first, self.palette_index = np.unique(codes, return_index=True, return_inverse=True)
+            self.palette_lightness = l.ravel()[self.indices][first]
+            self.palette_saturation = s.ravel()[self.indices][first]
+
+    @classmethod
+    def from_image(cls, image: Image.Image, profile: RecolorProfile,
+                   size: Optional[Tuple[int, int]] = None) -> 'PreparedTemplate':
+        """
+        Prepare a template from a PIL image (RGBA is composited onto white).
+        With size, the template is prescaled to it first (see prescale()).
+        """
+        with span('decode', size=list(size or image.size)):
+            rgb = np.array(prescale(image, size) if size else flatten_to_rgb(image))
+        return cls(rgb, profile)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], profile: RecolorProfile) -> 'PreparedTemplate':
+        """Rebuild a template from previously computed ARRAYS without touching the pixels."""
+        template = cls.__new__(cls)
+        template.profile = profile
+        for name in cls.ARRAYS:
+            setattr(template, name, arrays[name])
+        return template
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The cached arrays by name, see ARRAYS."""
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Template size as (width, height), like PIL."""
+        return self.rgb.shape[1], self.rgb.shape[0]
+
+    def render(self, target_rgb: Tuple[int, int, int]) -> np.ndarray:
+        """Return a recolored copy of the template as a uint8 (H, W, 3) array."""
+        with span('blend', colors=len(self.palette_lightness)):
+            palette = blend(self.palette_lightness, self.palette_saturation, target_rgb, self.profile)
+        with span('gather'):
+            result = self.rgb.copy()
+            result.reshape(-1, 3)[self.indices] = palette[self.palette_index]
+        return result
+
+    def render_image(self, target_rgb: Tuple[int, int, int]) -> Image.Image:
+        """Return a recolored copy of the template as a PIL image."""
+        return Image.fromarray(self.render(target_rgb), 'RGB')
+
+    def render_frame(self, target_rgb: Tuple[int, int, int]) -> Image.Image:
+        """
+        Recolor into this template's reusable buffer and return a PIL image
+        that shares its memory (RGBX, which PIL maps without copying).
+
+        Pixels outside the mask are the same for every product, so after
+        the first call only the masked pixels are rewritten. The image is
+        only valid until the next render_frame() on this template.
+        """
+        if self._frame is None:
+            height, width = self.rgb.shape[:2]
+            self._frame = np.full((height, width, 4), 255, dtype=np.uint8)
+            self._frame[..., :3] = self.rgb
+            self._gathered = np.empty((len(self.indices), 3), dtype=np.uint8)
+        with span('blend', colors=len(self.palette_lightness)):
+            palette = blend(self.palette_lightness, self.palette_saturation, target_rgb, self.profile)
+        with span('gather'):
+            # mode='clip' writes straight into out; 'raise' would buffer a copy
+            np.take(palette, self.palette_index, axis=0, out=self._gathered, mode='clip')
+            self._frame.reshape(-1, 4)[self.indices, :3] = self._gathered
+        return Image.frombuffer('RGBX', self.size, self._frame, 'raw', 'RGBX', 0, 1)
+
+
+def recolor_array(rgb: np.ndarray, target_rgb: Tuple[int, int, int], profile: RecolorProfile) -> np.ndarray:
+    """Recolor a uint8 (H, W, 3) array and return a new array."""
+    return PreparedTemplate(rgb, profile).render(target_rgb)
+
+
+def recolor_image(image: Image.Image, target_rgb: Tuple[int, int, int], profile: RecolorProfile) -> Image.Image:
+    """Recolor a PIL image; RGBA input is composited onto white first."""
+    return PreparedTemplate.from_image(image, profile).render_image(target_rgb)
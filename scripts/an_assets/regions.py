@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Region reads from large JPEG posters.
+A crop at least twice the output size does not need the poster at full
+resolution: JPEG DCT draft decoding yields it at 1/2, 1/4 or 1/8 scale
+for a quarter, a sixteenth or a sixty-fourth of the pixels. Pillow's
+decoder cannot stop before the last row, so every read decodes the whole
+poster at its scale. read_regions() therefore groups the crops by scale
+and decodes the poster once per group, so peak memory is one poster at
+the finest scale any crop needs.
+
+Other formats have no reduced-scale decode, so they are read in full.
+"""
+
+import math
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+
+
+def percent_box(size: Tuple[int, int], bbox_percent: list, padding: int = 5) -> Box:
+    """
+    Convert [left%, top%, right%, bottom%] to a pixel box with padding,
+    clamped to the image bounds.
+    """
+    width, height = size
+
+    left = int(width * bbox_percent[0] / 100) - padding
+    top = int(height * bbox_percent[1] / 100) - padding
+    right = int(width * bbox_percent[2] / 100) + padding
+    bottom = int(height * bbox_percent[3] / 100) + padding
+
+    return max(0, left), max(0, top), min(width, right), min(height, bottom)
+
+
+def draft_scale(box: Box, target_size: Tuple[int, int]) -> int:
+    """Largest JPEG DCT scale (1, 2, 4 or 8) that keeps the crop at least target_size."""
+    width, height = box[2] - box[0], box[3] - box[1]
+    scale = 1
+    while scale < 8 and width // (scale * 2) >= target_size[0] and height // (scale * 2) >= target_size[1]:
+        scale *= 2
+    return scale
+
+
+def _scale_box(box: Box, full_size: Tuple[int, int], size: Tuple[int, int]) -> Box:
+    """Map a box on the full image onto the same image decoded at size."""
+    fx, fy = size[0] / full_size[0], size[1] / full_size[1]
+    return (
+        int(box[0] * fx), int(box[1] * fy),
+        min(size[0], math.ceil(box[2] * fx)),
+        min(size[1], math.ceil(box[3] * fy)),
+    )
+
+
+def read_regions(path: Path, boxes: Sequence[Box],
+                 target_size: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Yield (index, crop) for every box, decoding the image at path once per
+    JPEG draft scale.
+
+    With target_size, each JPEG crop comes from the coarsest DCT scale that
+    still leaves it at least target_size. Coarser scales are decoded first.
+    Only one decode is held at a time, and each crop is a copy that
+    outlives it, so consume the crops as they are yielded.
+    """
+    with Image.open(path) as image:
+        full_size = image.size
+        jpeg = image.format == 'JPEG'
+    scales = [draft_scale(box, target_size) if jpeg and target_size else 1 for box in boxes]
+
+    for scale in sorted(set(scales), reverse=True):
+        with Image.open(path) as image:
+            if scale > 1:
+                image.draft(None, (full_size[0] // scale, full_size[1] // scale))
+            image.load()
+            for index, box in enumerate(boxes):
+                if scales[index] == scale:
+                    yield index, image.crop(_scale_box(box, full_size, image.size))
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped cache of prepared recolor templates.
+
+Preparing a template (decode, HLS conversion, mask, palette) costs more
+than rendering a product from it, and every run used to redo it for the
+same three source images. load_template() saves the PreparedTemplate
+ARRAYS as .npy files, keyed by the source file's hash, the profile and the
+prescale size. Later runs memory-map them read-only instead of decoding
+anything. Worker processes map the same files, so they share one copy of
+the pages through the OS page cache.
+
+Each entry is written to a temp directory and renamed into place, so a
+reader never sees a half-written template.
+"""
+
+import json
+import os
+import secrets
+import shutil
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .cache import CACHE_DIR, cache_key, file_digest
+from .files import atomic_write_text
+from .recolor import PreparedTemplate, RecolorProfile
+from .trace import span
+
+TEMPLATE_CACHE_DIR = CACHE_DIR / 'templates'
+
+# Bump whenever PreparedTemplate computes its arrays differently
+TEMPLATE_VERSION = 1
+
+
+def template_key(source_digest: str, profile: RecolorProfile, size: Optional[Tuple[int, int]] = None) -> str:
+    """Cache key covering everything that affects a prepared template's arrays."""
+    return cache_key(TEMPLATE_VERSION, source_digest, asdict(profile), list(size) if size else None)
+
+
+def map_template(directory: Path, profile: RecolorProfile) -> PreparedTemplate:
+    """Memory-map a cached template. Raises OSError/ValueError if it is missing or damaged."""
+    arrays = {name: np.load(directory / f"{name}.npy", mmap_mode='r') for name in PreparedTemplate.ARRAYS}
+    template = PreparedTemplate.from_arrays(arrays, profile)
+    template.cache_dir = directory
+    return template
+
+
+def _store(directory: Path, template: PreparedTemplate, source: Path) -> None:
+    tmp = directory.with_name(f'.{directory.name}.{secrets.token_hex(4)}.tmp')
+    tmp.mkdir(parents=True)
+    try:
+        for name, array in template.arrays().items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(array))
+        atomic_write_text(tmp / 'template.json', json.dumps({
+            'version': TEMPLATE_VERSION,
+            'source': source.name,
+            'size': list(template.size),
+        }) + '\n')
+        os.replace(tmp, directory)
+    except OSError:
+        # Another process stored the same key first; its copy is as good
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not directory.exists():
+            raise
+
+
+def load_template(source: Path, profile: RecolorProfile, size: Optional[Tuple[int, int]] = None,
+                  digest: Optional[str] = None, root: Path = TEMPLATE_CACHE_DIR) -> PreparedTemplate:
+    """
+    Prepare the template for source (prescaled to size, if given), or
+    memory-map it from the cache when it was prepared before. Pass digest
+    when the caller already hashed source, e.g. via the manifest.
+    """
+    key = template_key(digest or file_digest(source), profile, size)
+    directory = root / key[:2] / key
+    if directory.exists():
+        with span('template', source=source.name, cached=True):
+            try:
+                return map_template(directory, profile)
+            except (OSError, ValueError):
+                # Damaged entry: prepare it again below
+                shutil.rmtree(directory, ignore_errors=True)
+
+    with span('template', source=source.name, cached=False):
+        with Image.open(source) as image:
+            template = PreparedTemplate.from_image(image, profile, size)
+        _store(directory, template, source)
+    # Map what was just written, so worker processes can map the same files
+    return map_template(directory, profile)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Span timers, optional cProfile capture and run reports.
+
+Code marks work with `with span('encode', code=...)`. While tracing is off,
+span() returns a shared no-op context manager after a single flag check,
+so instrumented hot paths cost next to nothing. When tracing is on, each
+span becomes a Chrome trace "complete" event.
+
+A script calls start(args, BUILDER) after parsing --trace / --profile (see
+add_arguments), or picks tracing up from the AN_TRACE_DIR / AN_PROFILE
+environment variables set by `python -m an_assets build --trace DIR`. At
+exit it writes one JSON file that chrome://tracing or Perfetto can open.
+The same file has a per-span-name summary under "summary". With
+--profile, cProfile output is saved next to it as .prof.
+
+Worker processes record into their own buffer. They hand events back with
+capture() and the parent adds them with merge().
+"""
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .cache import CACHE_DIR
+from .files import atomic_write_text
+
+TRACE_DIR = CACHE_DIR / 'trace'
+TRACE_DIR_ENV = 'AN_TRACE_DIR'
+PROFILE_ENV = 'AN_PROFILE'
+
+_NULL = nullcontext()
+
+_enabled = False
+_events: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+_epoch = time.perf_counter()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'lane', 'start')
+
+    def __init__(self, name: str, lane: Optional[int], args: Dict[str, Any]):
+        self.name = name
+        self.lane = lane
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        event = {
+            'name': self.name, 'ph': 'X', 'pid': os.getpid(),
+            'tid': self.lane if self.lane is not None else threading.get_ident(),
+            'ts': round((self.start - _epoch) * 1e6, 1), 'dur': round((end - self.start) * 1e6, 1),
+        }
+        if self.args:
+            event['args'] = self.args
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def span(name: str, lane: Optional[int] = None, **args: Any):
+    """
+    Time a block as a trace event named name, with args attached.
+    lane puts overlapping async work (one per request) on its own row.
+    """
+    if not _enabled:
+        return _NULL
+    return _Span(name, lane, args)
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+@contextmanager
+def capture() -> Iterator[List[Dict[str, Any]]]:
+    """Collect the events recorded inside the block, e.g. to return them from a worker process."""
+    with _lock:
+        start = len(_events)
+    captured: List[Dict[str, Any]] = []
+    try:
+        yield captured
+    finally:
+        with _lock:
+            captured.extend(_events[start:])
+            del _events[start:]
+
+
+def merge(events: List[Dict[str, Any]]) -> None:
+    """Add events recorded in another process."""
+    if _enabled and events:
+        with _lock:
+            _events.extend(events)
+
+
+def summary(events: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Count, total, mean and max milliseconds per span name, slowest total first."""
+    totals: Dict[str, List[float]] = {}
+    for event in events:
+        totals.setdefault(event['name'], []).append(event['dur'] / 1000)
+    rows = {
+        name: {'count': len(times), 'total_ms': round(sum(times), 2),
+               'mean_ms': round(sum(times) / len(times), 2), 'max_ms': round(max(times), 2)}
+        for name, times in totals.items()
+    }
+    return dict(sorted(rows.items(), key=lambda row: -row[1]['total_ms']))
+
+
+def write_report(path: Path, name: str) -> Dict[str, Dict[str, float]]:
+    """Write the Chrome trace + summary JSON and return the summary."""
+    with _lock:
+        events = list(_events)
+    rows = summary(events)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(path, json.dumps({
+        'name': name,
+        'displayTimeUnit': 'ms',
+        'summary': rows,
+        'traceEvents': events,
+    }) + '\n')
+    return rows
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--trace', type=Path, metavar='PATH',
+                        help="Write span timings as a JSON / Chrome trace report to PATH")
+    parser.add_argument('--profile', action='store_true',
+                        help="Also run cProfile and save it next to the trace as .prof")
+
+
+def start(args: Optional[argparse.Namespace], name: str) -> Optional[Path]:
+    """
+    Turn tracing on if --trace/--profile or AN_TRACE_DIR/AN_PROFILE ask for
+    it. The report is written at exit. Returns the report path, or None
+    when tracing stays off.
+    """
+    path = getattr(args, 'trace', None)
+    profile = bool(getattr(args, 'profile', False)) or os.environ.get(PROFILE_ENV) == '1'
+    if path is None and os.environ.get(TRACE_DIR_ENV):
+        path = Path(os.environ[TRACE_DIR_ENV]) / f"{name}.json"
+    if path is None and profile:
+        path = TRACE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    if path is None:
+        return None
+
+    enable()
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    run = _Span(name, None, {})
+    run.__enter__()
+
+    def finish():
+        run.__exit__(None, None, None)
+        rows = write_report(Path(path), name)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(str(Path(path).with_suffix('.prof')))
+        print(f"\nTrace: {path}")
+        for span_name, row in list(rows.items())[:8]:
+            print(f"  {span_name:<20} {row['count']:>5} x  {row['total_ms']:>10.1f} ms total  "
+                  f"{row['mean_ms']:>8.1f} ms mean")
+
+    atexit.register(finish)
+    return Path(path)
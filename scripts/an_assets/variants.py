@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Responsive image variants: a width ladder of each product image in AVIF,
+WebP and JPEG. Each source is decoded once and every size is resized from
+the full image; each size is encoded in every format.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+from .files import atomic_writer
+
+WIDTHS = (96, 192, 300, 600)
+
+# Pillow format name, file extension and encoder settings per variant format
+FORMATS: Dict[str, Tuple[str, str, dict]] = {
+    'avif': ('AVIF', 'avif', {'quality': 55, 'speed': 6}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 5}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Bump whenever encode settings or resizing change
+VARIANT_VERSION = 1
+
+
+def available_formats(formats: Sequence[str]) -> List[str]:
+    """The formats this Pillow build can encode."""
+    checks = {'avif': 'avif', 'webp': 'webp'}
+    return [fmt for fmt in formats if fmt not in checks or features.check(checks[fmt])]
+
+
+def ladder(size: Tuple[int, int], widths: Sequence[int] = WIDTHS) -> List[Tuple[int, int]]:
+    """(width, height) steps no wider than the source, keeping aspect ratio."""
+    width, height = size
+    steps = [w for w in widths if w < width] + [min(width, max(widths))]
+    return [(w, max(1, round(height * w / width))) for w in sorted(set(steps))]
+
+
+def variant_path(out_dir: Path, stem: str, width: int, fmt: str) -> Path:
+    return out_dir / f"{stem}-{width}.{FORMATS[fmt][1]}"
+
+
+@dataclass(frozen=True)
+class VariantResult:
+    source: Path
+    size: Tuple[int, int] = (0, 0)
+    # [(width, height, format, path, bytes)]
+    outputs: List[Tuple[int, int, str, Path, int]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def encode_variants(source: Path, out_dir: Path, widths: Sequence[int] = WIDTHS,
+                    formats: Sequence[str] = tuple(FORMATS)) -> VariantResult:
+    """Write every width x format variant of source. Errors are returned, not raised."""
+    try:
+        with Image.open(source) as image:
+            image = image.convert('RGB')
+        outputs = []
+        for width, height in ladder(image.size, widths):
+            resized = image if (width, height) == image.size else image.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                pil_format, _, settings = FORMATS[fmt]
+                path = variant_path(out_dir, source.stem, width, fmt)
+                with atomic_writer(path) as f:
+                    resized.save(f, pil_format, **settings)
+                outputs.append((width, height, fmt, path, path.stat().st_size))
+        return VariantResult(source, image.size, outputs)
+    except Exception as e:
+        return VariantResult(source, error=str(e))
+
+
+def encode_all(sources: List[Path], out_dir: Path, widths: Sequence[int] = WIDTHS,
+               formats: Sequence[str] = tuple(FORMATS), workers: int = 1) -> Iterator[VariantResult]:
+    """Encode sources across a process pool and yield results as they finish."""
+    if workers <= 1 or len(sources) <= 1:
+        for source in sources:
+            yield encode_variants(source, out_dir, widths, formats)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+        futures = [pool.submit(encode_variants, source, out_dir, tuple(widths), tuple(formats)) for source in sources]
+        for future in as_completed(futures):
+            yield future.result()
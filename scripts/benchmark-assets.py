@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the AN Milk Tea image pipeline hot paths.
+Times recolor_drink, recolor_cup and extract_drink_image at 600px, at the
+template sizes and on a 6000px poster. It also times the per-product
+batch render (template at full size or prescaled to the output size) and
+template startup, prepared from the image file or mapped from the
+template cache. The shipped templates are PNGs too small for DCT draft
+decoding, so prescaling is timed on a 2x copy saved as PNG and as JPEG.
+Downloads are timed against a local HTTP server and Imagen generation
+against a fake client, so no network or API key is needed.
+Each case runs in its own process, so peak RSS is per case. Results are
+appended to .cache/an-assets/bench/history.json and compared with the
+previous run, or with a labelled baseline.
+
+--prescale-quality compares every catalogue product rendered both ways
+(SSIM on luma, PSNR on RGB) instead of timing anything, and appends the
+report to .cache/an-assets/bench/quality.json instead.
+"""
+
+import io
+import sys
+import json
+import asyncio
+import argparse
+import importlib.util
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    print("Error: Pillow / numpy not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
+    sys.exit(1)
+
+from an_assets.bench import (HISTORY_PATH, QUALITY_HISTORY_PATH, BenchResult, append_history, environment,
+                             find_baseline, load_history, measure)
+from an_assets.catalog import load_catalog
+from an_assets.download import ConnectionPool, HttpCache, fetch_all
+from an_assets.encode import luma, ssim
+from an_assets.imagegen import ImageRequest, generate_all
+from an_assets.recolor import FRUITTEA_PROFILE, MILKTEA_PROFILE, PAPER_CUP_PROFILE, PreparedTemplate, flatten_to_rgb
+from an_assets.regions import percent_box
+from an_assets.templates import load_template
+
+# Paths
+SCRIPTS_DIR = Path(__file__).parent
+IMAGES_DIR = SCRIPTS_DIR.parent / 'public' / 'images'
+MILKTEA_IMAGE = IMAGES_DIR / 'original-cup.jpg'
+FRUITTEA_IMAGE = IMAGES_DIR / 'original-tea.jpg'
+PAPER_CUP_IMAGE = IMAGES_DIR / 'paper-cup-an.jpg'
+MENU_IMAGE = IMAGES_DIR / 'menu-an.jpg'
+
+POSTER_WIDTH = 6000
+OUTPUT_SIDE = 600
+TARGET_RGB = (120, 80, 50)
+
+# Batch templates: (image, profile, output size). The cup script writes
+# 600x600; the drink script keeps the template size, so the drinks are
+# measured at half size. The templates are PNGs despite their .jpg names,
+# so draft decoding never applies to them (see prescale_case()).
+BATCH_TEMPLATES = {
+    'cup': (PAPER_CUP_IMAGE, PAPER_CUP_PROFILE, (OUTPUT_SIDE, OUTPUT_SIDE)),
+    'milktea': (MILKTEA_IMAGE, MILKTEA_PROFILE, (171, 256)),
+    'fruittea': (FRUITTEA_IMAGE, FRUITTEA_PROFILE, (171, 256)),
+}
+
+# Download / generation fakes
+DOWNLOAD_IMAGES = 24
+GENERATE_IMAGES = 40
+FAKE_API_LATENCY = 0.05
+
+
+def load_script(name: str):
+    """Import one of the kebab-case scripts in scripts/ as a module."""
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), SCRIPTS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def square(image: Image.Image, side: int) -> Image.Image:
+    return image.convert('RGB').resize((side, side), Image.Resampling.LANCZOS)
+
+
+def large_template(work_dir: Path, fmt: str) -> Path:
+    """The milk tea template flattened, upscaled 2x and saved as PNG or JPEG."""
+    path = work_dir / f"milktea-template-2x.{fmt.lower()}"
+    if not path.exists():
+        with Image.open(MILKTEA_IMAGE) as image:
+            image = flatten_to_rgb(image)
+            image = image.resize((image.width * 2, image.height * 2), Image.Resampling.BICUBIC)
+            image.save(path, fmt, **({'quality': 95} if fmt == 'JPEG' else {}))
+    return path
+
+
+def poster(work_dir: Path) -> Path:
+    """The menu poster upscaled to POSTER_WIDTH and saved as JPEG."""
+    path = work_dir / 'poster.jpg'
+    if not path.exists():
+        with Image.open(MENU_IMAGE) as menu:
+            height = round(menu.height * POSTER_WIDTH / menu.width)
+            menu.convert('RGB').resize((POSTER_WIDTH, height), Image.Resampling.BICUBIC).save(path, quality=90)
+    return path
+
+
+# === Recolor ===
+
+def recolor_drink_case(side: int = 0):
+    drink = load_script('recolor-drink-images')
+    image = Image.open(MILKTEA_IMAGE)
+    image.load()
+    if side:
+        image = square(image, side)
+
+    def run():
+        drink.recolor_drink(image, TARGET_RGB, 'milktea')
+    return run, 1, image.width * image.height
+
+
+def recolor_cup_case(side: int = 0):
+    cup = load_script('recolor-paper-cup')
+    image = Image.open(PAPER_CUP_IMAGE)
+    image.load()
+    if side:
+        image = square(image, side)
+
+    def run():
+        # As the script does: recolor, then resize to the 600px output
+        cup.recolor_cup(image, TARGET_RGB).resize((OUTPUT_SIDE, OUTPUT_SIDE), Image.Resampling.LANCZOS)
+    return run, 1, image.width * image.height
+
+
+def batch_template(kind: str, prescaled: bool) -> Tuple[PreparedTemplate, Tuple[int, int]]:
+    path, profile, size = BATCH_TEMPLATES[kind]
+    with Image.open(path) as image:
+        return PreparedTemplate.from_image(image, profile, size if prescaled else None), size
+
+
+def render_batch(template: PreparedTemplate, size: Tuple[int, int], target_rgb) -> Image.Image:
+    """One product as pool.render_job renders it, minus the JPEG encode."""
+    image = template.render_frame(target_rgb)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+
+def batch_case(kind: str, prescaled: bool):
+    """Per-product cost once the template is prepared for the batch."""
+    template, size = batch_template(kind, prescaled)
+
+    def run():
+        render_batch(template, size, TARGET_RGB)
+    return run, 1, template.rgb.shape[0] * template.rgb.shape[1]
+
+
+def template_case(work_dir: Path, cached: bool):
+    """Startup cost of the paper cup template: prepared from the image file, or mapped from the template cache."""
+    path, profile, _ = BATCH_TEMPLATES['cup']
+    root = work_dir / 'templates'
+
+    def run():
+        if cached:
+            # The warm-up call stores it, so every timed call maps the cache
+            load_template(path, profile, root=root)
+        else:
+            with Image.open(path) as image:
+                PreparedTemplate.from_image(image, profile)
+    with Image.open(path) as image:
+        return run, 1, image.width * image.height
+
+
+def prescale_case(work_dir: Path, jpeg: bool):
+    """
+    Preparing a 2x milk tea template at the drink output size: a full PNG
+    decode, or a JPEG that draft() decodes at 1/2 scale.
+    """
+    path = large_template(work_dir, 'JPEG' if jpeg else 'PNG')
+    _, profile, size = BATCH_TEMPLATES['milktea']
+
+    def run():
+        # A fresh open each time: draft() only applies before the first load
+        with Image.open(path) as image:
+            PreparedTemplate.from_image(image, profile, size)
+    with Image.open(path) as image:
+        return run, 1, image.width * image.height
+
+
+def psnr(reference: Image.Image, distorted: Image.Image) -> float:
+    """PSNR over the R, G and B channels; render_frame()'s constant X channel would inflate it."""
+    reference = np.asarray(reference.convert('RGB'), dtype=np.float64)
+    distorted = np.asarray(distorted.convert('RGB'), dtype=np.float64)
+    mse = np.mean((reference - distorted) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def prescale_quality() -> Dict[str, dict]:
+    """
+    Render every catalogue product both ways (recolor the full template then
+    resize, and recolor the prescaled template) and compare the results.
+    """
+    catalog = load_catalog()
+    products = {
+        'cup': [(p.code, p.cup_rgb) for p in catalog.with_cup()],
+        'milktea': [(p.code, p.drink_rgb) for p in catalog.with_drink() if p.drink_template == 'milktea'],
+        'fruittea': [(p.code, p.drink_rgb) for p in catalog.with_drink() if p.drink_template != 'milktea'],
+    }
+    report = {}
+    for kind, targets in products.items():
+        if not targets:
+            continue
+        full, size = batch_template(kind, prescaled=False)
+        small, _ = batch_template(kind, prescaled=True)
+        scores: List[Tuple[float, float, str]] = []
+        for code, target_rgb in targets:
+            reference = render_batch(full, size, target_rgb)
+            distorted = render_batch(small, size, target_rgb)
+            scores.append((ssim(luma(reference), luma(distorted)), psnr(reference, distorted), code))
+        worst = min(scores)
+        report[kind] = {
+            'products': len(scores),
+            'size': list(size),
+            'template_pixels': full.rgb.shape[0] * full.rgb.shape[1],
+            'output_pixels': size[0] * size[1],
+            'ssim_mean': round(sum(s for s, _, _ in scores) / len(scores), 5),
+            'ssim_min': round(worst[0], 5),
+            'psnr_mean_db': round(sum(p for _, p, _ in scores) / len(scores), 2),
+            'psnr_min_db': round(min(p for _, p, _ in scores), 2),
+            'worst': worst[2],
+        }
+    return report
+
+
+# === Extract ===
+
+def extract_case(work_dir: Path, source: Path, tiled: bool):
+    extract = load_script('extract-menu-images')
+    out_dir = work_dir / 'extract'
+    out_dir.mkdir(exist_ok=True)
+    drinks = extract.DRINK_PHOTOS
+    with Image.open(source) as menu:
+        size = menu.size
+    pixels = 0
+    for drink in drinks:
+        left, top, right, bottom = percent_box(size, drink['bbox'], extract.CROP_PADDING)
+        pixels += (right - left) * (bottom - top)
+
+    def run():
+        # One stage run: open the poster, then cut every drink
+        if tiled:
+            for _ in extract.extract_drinks_tiled(source, size, drinks, out_dir):
+                pass
+            return
+        with Image.open(source) as menu:
+            menu.load()
+            for drink in drinks:
+                extract.extract_drink_image(menu, drink['bbox'], out_dir / f"{drink['name']}.jpg")
+    return run, len(drinks), pixels
+
+
+# === Download (local HTTP server) ===
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    bodies: Dict[str, bytes] = {}
+
+    def do_GET(self):
+        body = self.bodies.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{len(body)}-{hash(body) & 0xffffffff:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def download_case(work_dir: Path, conditional: bool):
+    with Image.open(MILKTEA_IMAGE) as image:
+        base = square(image, OUTPUT_SIDE)
+    bodies = {}
+    for i in range(DOWNLOAD_IMAGES):
+        buffer = io.BytesIO()
+        base.rotate(i * 15).save(buffer, 'JPEG', quality=85)
+        bodies[f'/img/{i}.jpg'] = buffer.getvalue()
+    _ImageHandler.bodies = bodies
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f'http://127.0.0.1:{server.server_address[1]}{path}' for path in bodies]
+    cache_root = work_dir / 'http'
+
+    def run():
+        if not conditional:
+            # Cold: every body is downloaded again
+            shutil.rmtree(cache_root, ignore_errors=True)
+        cache = HttpCache(cache_root)
+        pool = ConnectionPool()
+        try:
+            for result in fetch_all(urls, cache, pool=pool, conditional=conditional):
+                if not result.ok:
+                    raise RuntimeError(result.error)
+        finally:
+            pool.close()
+            cache.save()
+    return run, len(urls), len(urls) * OUTPUT_SIDE * OUTPUT_SIDE
+
+
+# === Generation (fake Imagen client) ===
+
+class _FakeModels:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def generate_images(self, model, prompt, config):
+        await asyncio.sleep(FAKE_API_LATENCY)
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=SimpleNamespace(image_bytes=self.body))])
+
+
+def generate_case(work_dir: Path):
+    with Image.open(MILKTEA_IMAGE) as image:
+        buffer = io.BytesIO()
+        square(image, OUTPUT_SIDE).save(buffer, 'JPEG', quality=85)
+    client = SimpleNamespace(aio=SimpleNamespace(models=_FakeModels(buffer.getvalue())))
+    out_dir = work_dir / 'generated'
+    out_dir.mkdir(exist_ok=True)
+    requests = [ImageRequest(f'product-{i}', f'prompt {i}', out_dir / f'product-{i}.jpg')
+                for i in range(GENERATE_IMAGES)]
+
+    async def generate():
+        async for result in generate_all(client, requests, 'fake-model', None, concurrency=8, rpm=60000):
+            if not result.ok:
+                raise RuntimeError(result.error)
+
+    def run():
+        asyncio.run(generate())
+    return run, len(requests), len(requests) * OUTPUT_SIDE * OUTPUT_SIDE
+
+
+# name -> factory(work_dir) returning (run, images per run, pixels per run)
+CASES: Dict[str, Callable[[Path], Tuple[Callable[[], None], int, int]]] = {
+    'recolor-drink-600': lambda work: recolor_drink_case(OUTPUT_SIDE),
+    'recolor-drink-template': lambda work: recolor_drink_case(),
+    'recolor-cup-600': lambda work: recolor_cup_case(OUTPUT_SIDE),
+    'recolor-cup-template': lambda work: recolor_cup_case(),
+    'recolor-cup-batch': lambda work: batch_case('cup', prescaled=False),
+    'recolor-cup-prescaled': lambda work: batch_case('cup', prescaled=True),
+    'recolor-drink-batch-half': lambda work: batch_case('milktea', prescaled=False),
+    'recolor-drink-prescaled-half': lambda work: batch_case('milktea', prescaled=True),
+    'template-prepare': lambda work: template_case(work, cached=False),
+    'template-mapped': lambda work: template_case(work, cached=True),
+    'template-prescale-png': lambda work: prescale_case(work, jpeg=False),
+    'template-prescale-jpeg': lambda work: prescale_case(work, jpeg=True),
+    'extract-menu': lambda work: extract_case(work, MENU_IMAGE, tiled=False),
+    'extract-poster': lambda work: extract_case(work, poster(work), tiled=False),
+    'extract-poster-tiled': lambda work: extract_case(work, poster(work), tiled=True),
+    'download-cold': lambda work: download_case(work, conditional=False),
+    'download-revalidate': lambda work: download_case(work, conditional=True),
+    'generate-fake': lambda work: generate_case(work),
+}
+
+
+def run_case(name: str, work_dir: Path, repeats: int) -> BenchResult:
+    run, images, pixels = CASES[name](work_dir)
+    return measure(name, run, images, pixels, repeats)
+
+
+def run_isolated(name: str, work_dir: Path, repeats: int) -> dict:
+    """Run one case in a fresh interpreter so its peak RSS is its own."""
+    process = subprocess.run([sys.executable, __file__, '--case', name, '--repeat', str(repeats),
+                              '--work-dir', str(work_dir)], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed')
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def change(current: float, previous: float) -> str:
+    if not previous:
+        return ''
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline hot paths.")
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help=f"Cases to run (default all): {', '.join(CASES)}")
+    parser.add_argument('--repeat', '-r', type=int, default=5, metavar='N',
+                        help="Timed repeats per case after one warm-up (default 5)")
+    parser.add_argument('--label', metavar='NAME',
+                        help="Name this run in the history, e.g. 'baseline'")
+    parser.add_argument('--baseline', metavar='NAME',
+                        help="Compare with the newest run labelled NAME (default: the previous run)")
+    parser.add_argument('--history', type=Path, metavar='PATH',
+                        help="JSON history file (default .cache/an-assets/bench/history.json, "
+                             "or quality.json with --prescale-quality)")
+    parser.add_argument('--no-save', action='store_true',
+                        help="Don't append this run to the history")
+    parser.add_argument('--prescale-quality', action='store_true',
+                        help="Compare every product rendered at full template size then resized with the "
+                             "prescaled render, instead of timing cases")
+    # Internal: run one case in this process and print its result as JSON
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.history is None:
+        args.history = QUALITY_HISTORY_PATH if args.prescale_quality else HISTORY_PATH
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.work_dir, args.repeat).to_dict()))
+        return
+
+    if args.prescale_quality:
+        print("AN Milk Tea - Prescale Quality")
+        print("=" * 50)
+        report = prescale_quality()
+        for kind, row in report.items():
+            print(f"  {kind:<9} {row['products']:>3} products at {row['size'][0]}x{row['size'][1]}  "
+                  f"{row['template_pixels'] / row['output_pixels']:5.2f}x fewer pixels  "
+                  f"SSIM mean {row['ssim_mean']:.4f} min {row['ssim_min']:.4f}  "
+                  f"PSNR mean {row['psnr_mean_db']:.1f} dB min {row['psnr_min_db']:.1f} dB  "
+                  f"worst {row['worst']}")
+        if not args.no_save:
+            append_history({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'label': args.label,
+                            'environment': environment(), 'prescale_quality': report}, args.history)
+        print("\n" + "=" * 50)
+        print(f"Success: {len(report)}")
+        print("Failed: 0")
+        return
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        print(f"Error: unknown case(s): {', '.join(unknown)}")
+        sys.exit(1)
+    cases = args.cases or list(CASES)
+
+    print("AN Milk Tea - Pipeline Benchmark")
+    print(f"Cases: {len(cases)}  Repeats: {args.repeat}")
+    print("=" * 50)
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, args.baseline)
+    previous = (baseline or {}).get('results', {})
+    if args.baseline and not baseline:
+        print(f"Warning: no run labelled '{args.baseline}' in {args.history}")
+
+    success = 0
+    failed = 0
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='an-bench-') as work:
+        for name in cases:
+            try:
+                result = run_isolated(name, Path(work), args.repeat)
+            except Exception as e:
+                print(f"  [ERROR] {name}: {e}")
+                failed += 1
+                continue
+            results[name] = result
+            old = previous.get(name, {})
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+            print(f"  {name:<28} {result['seconds_median'] * 1000:9.1f} ms  "
+                  f"{result['megapixels_per_s']:8.2f} MP/s  {result['images_per_s']:8.2f} img/s  "
+                  f"RSS {rss:>7}  {change(result['seconds_median'], old.get('seconds_median', 0))}")
+            success += 1
+
+    if results and not args.no_save:
+        append_history({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'label': args.label,
+                        'environment': environment(), 'repeats': args.repeat, 'results': results}, args.history)
+
+    print("\n" + "=" * 50)
+    print(f"Success: {success}")
+    print(f"Failed: {failed}")
+    if baseline:
+        print(f"Compared with: {baseline.get('label') or baseline.get('time')} (time change per case)")
+    if not args.no_save:
+        print(f"History: {args.history}")
+
+
+if __name__ == '__main__':
+    main()
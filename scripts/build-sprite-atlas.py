@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pack AN Milk Tea product thumbnails into sprite atlases.
+Identical images (same file hash) share one sprite, and every thumbnail at
+the chosen size goes into as few sheets as fit, so a grid of thumbnails
+could load a couple of atlas images instead of one request per product.
+No component renders sprites (the menu serves each product's resized
+variants instead), so nothing here is shipped: the sheets and their map
+are written to .cache/an-assets/atlas/. A consumer would copy the sheets
+under public/ and read the map on the server or at build time.
+"""
+
+import sys
+import io
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    print("Error: Pillow not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
+    sys.exit(1)
+
+from an_assets.atlas import MAX_SHEET_SIZE, PADDING, render_sheets, shelf_pack
+from an_assets.cache import CACHE_DIR, cache_key, file_digest
+from an_assets.files import atomic_write_bytes, atomic_write_text
+from an_assets import trace
+
+# Paths
+PUBLIC_DIR = Path(__file__).parent.parent / 'public'
+SOURCE_DIRS = [PUBLIC_DIR / 'images' / 'products']
+ATLAS_DIR = CACHE_DIR / 'atlas'
+MAP_PATH = ATLAS_DIR / 'atlas.json'
+
+DEFAULT_SIZE = 192
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 5}), 'jpeg': ('JPEG', {'quality': 82, 'optimize': True})}
+
+# Bump whenever sheet output changes for the same inputs
+ATLAS_VERSION = 1
+
+
+def public_url(path: Path) -> str:
+    """URL the Next.js app serves a file under public/ at."""
+    return '/' + path.resolve().relative_to(PUBLIC_DIR.resolve()).as_posix()
+
+
+def thumbnail(path: Path, size: int) -> Image.Image:
+    """Center-cropped size x size RGB thumbnail, decoded at reduced JPEG scale."""
+    with Image.open(path) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+    return ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+
+def load_map() -> dict:
+    if not MAP_PATH.exists():
+        return {}
+    try:
+        return json.loads(MAP_PATH.read_text(encoding='utf-8')).get('atlases', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pack product thumbnails into sprite atlases.")
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, metavar='PX',
+                        help=f"Thumbnail size in pixels (default {DEFAULT_SIZE})")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='webp',
+                        help="Sheet image format (default webp)")
+    parser.add_argument('--max-sheet', type=int, default=MAX_SHEET_SIZE, metavar='PX',
+                        help=f"Maximum sheet width/height (default {MAX_SHEET_SIZE})")
+    parser.add_argument('--dir', action='append', type=Path, metavar='DIR',
+                        help="Source image folder; repeatable (default public/images/products)")
+    parser.add_argument('--force', action='store_true',
+                        help="Rebuild the atlas even if no source image changed")
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    args.dir = args.dir or SOURCE_DIRS
+    return args
+
+
+def main():
+    args = parse_args()
+    trace.start(args, 'build-sprite-atlas')
+
+    print("AN Milk Tea - Sprite Atlas Packer")
+    print("=" * 50)
+
+    sources = [
+        path for source_dir in args.dir
+        for path in sorted(source_dir.glob('*.jpg')) if not path.name.startswith('.')
+    ]
+    digests = {public_url(path): file_digest(path) for path in sources}
+    params = cache_key(ATLAS_VERSION, args.size, args.format, FORMATS[args.format], args.max_sheet, PADDING, digests)
+
+    atlases = load_map()
+    key = str(args.size)
+    previous = atlases.get(key, {})
+    if (not args.force and previous.get('params') == params
+            and all((ATLAS_DIR / sheet['file']).exists() for sheet in previous.get('sheets', []))):
+        print(f"[SKIP] {args.size}px atlas up to date ({len(sources)} images)")
+        return
+
+    # One sprite per distinct file
+    unique: Dict[str, Path] = {}
+    for path in sources:
+        unique.setdefault(digests[public_url(path)], path)
+    print(f"Images: {len(sources)}  Unique: {len(unique)}  Size: {args.size}px")
+
+    hashes = list(unique)
+    with trace.span('thumbnails', count=len(hashes)):
+        thumbs = [thumbnail(unique[digest], args.size) for digest in hashes]
+    with trace.span('pack'):
+        slots, sheet_sizes = shelf_pack([thumb.size for thumb in thumbs], args.max_sheet)
+        canvases = render_sheets(thumbs, slots, sheet_sizes)
+
+    pil_format, settings = FORMATS[args.format]
+    extension = 'jpg' if args.format == 'jpeg' else args.format
+    sheets: List[dict] = []
+    written = set()
+    ATLAS_DIR.mkdir(parents=True, exist_ok=True)
+    for index, canvas in enumerate(canvases):
+        buffer = io.BytesIO()
+        with trace.span('encode', sheet=index):
+            canvas.save(buffer, pil_format, **settings)
+        data = buffer.getvalue()
+        # Content hash in the name, so sheets can be cached forever
+        path = ATLAS_DIR / f"atlas-{args.size}-{index}-{hashlib.sha256(data).hexdigest()[:10]}.{extension}"
+        atomic_write_bytes(path, data)
+        written.add(path.name)
+        sheets.append({'file': path.name, 'width': canvas.width, 'height': canvas.height})
+        print(f"  [OK] {path.name}: {canvas.width}x{canvas.height}, {len(data) // 1024} KB")
+
+    # Sheets from earlier builds at this size are no longer referenced
+    for old in ATLAS_DIR.glob(f"atlas-{args.size}-*"):
+        if old.name not in written:
+            old.unlink()
+
+    slot_by_hash = dict(zip(hashes, slots))
+    images = {}
+    for url, digest in digests.items():
+        slot = slot_by_hash[digest]
+        images[url] = {'sheet': slot.sheet, 'x': slot.x, 'y': slot.y, 'width': slot.width, 'height': slot.height}
+
+    atlases[key] = {'params': params, 'sheets': sheets, 'images': images}
+    atomic_write_text(MAP_PATH, json.dumps({'atlases': dict(sorted(atlases.items()))},
+                                           indent=2, ensure_ascii=False) + '\n')
+
+    print("\n" + "=" * 50)
+    print(f"Sprites: {len(sources)} ({len(sources) - len(unique)} duplicates shared)")
+    print(f"Sheets: {len(sheets)}")
+    print(f"Map: {MAP_PATH}")
+
+
+if __name__ == '__main__':
+    main()
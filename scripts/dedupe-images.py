@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Find duplicate and near-duplicate AN Milk Tea images.
+Hashes every image in public/images/products and public/images/menu-extracted
+(stock downloads included) with pHash + dHash + a color thumbnail, groups
+near-identical ones, and picks one canonical file per group. Writes the
+alias -> canonical map to src/lib/data/product-image-aliases.json, which
+getProductImage() resolves aliases through and which ships to the browser,
+so it holds nothing else. The groups with their distances and the
+product-images.ts mappings rewritten to canonical files go to a report in
+.cache/an-assets/dedupe-report.json. --apply also deletes the alias files;
+later runs keep the aliases of files deleted that way, since those URLs
+are still referenced and only resolve through the map.
+"""
+
+import re
+import sys
+import io
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+try:
+    # Only an_assets.phash uses numpy and Pillow; check for them up front
+    import numpy  # noqa: F401
+    import PIL  # noqa: F401
+except ImportError:
+    print("Error: Pillow / numpy not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
+    sys.exit(1)
+
+from an_assets.cache import CACHE_DIR
+from an_assets.files import atomic_write_text
+from an_assets.manifest import Manifest
+from an_assets.phash import COLOR_TOLERANCE, hamming, image_hash, near_duplicate_groups
+from an_assets import trace
+
+# Paths
+PUBLIC_DIR = Path(__file__).parent.parent / 'public'
+SOURCE_DIRS = [
+    PUBLIC_DIR / 'images' / 'products',
+    PUBLIC_DIR / 'images' / 'menu-extracted',
+]
+MAPPING_TS = Path(__file__).parent.parent / 'src' / 'lib' / 'data' / 'product-images.ts'
+OUTPUT_PATH = Path(__file__).parent.parent / 'src' / 'lib' / 'data' / 'product-image-aliases.json'
+REPORT_PATH = CACHE_DIR / 'dedupe-report.json'
+
+DEFAULT_THRESHOLD = 2
+
+# 'key': '/images/...' entries of the two maps in product-images.ts
+MAP_BLOCK = re.compile(r"export const (\w+): Record<string, string> = \{(.*?)\n\};", re.S)
+MAP_ENTRY = re.compile(r"^\s*'([^']+)':\s*'([^']+)'", re.M)
+
+
+def public_url(path: Path) -> str:
+    """URL the Next.js app serves a file under public/ at."""
+    return '/' + path.resolve().relative_to(PUBLIC_DIR.resolve()).as_posix()
+
+
+def load_aliases() -> Dict[str, str]:
+    """The alias map written by the previous run, or {} if there is none."""
+    if not OUTPUT_PATH.exists():
+        return {}
+    try:
+        return json.loads(OUTPUT_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def read_mappings() -> Dict[str, Dict[str, str]]:
+    """{map name: {key: image URL}} from product-images.ts."""
+    text = MAPPING_TS.read_text(encoding='utf-8')
+    return {name: dict(MAP_ENTRY.findall(body)) for name, body in MAP_BLOCK.findall(text)}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Group duplicate product images and write an alias map.")
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD, metavar='BITS',
+                        help=f"Maximum pHash/dHash Hamming distance (default {DEFAULT_THRESHOLD})")
+    parser.add_argument('--color-tolerance', type=float, default=COLOR_TOLERANCE, metavar='N',
+                        help=f"Maximum mean color difference, 0-255 (default {COLOR_TOLERANCE})")
+    parser.add_argument('--apply', action='store_true',
+                        help="Delete alias files, keeping only canonical ones "
+                             "(build scripts recreate them unless removed from their tables)")
+    trace.add_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    trace.start(args, 'dedupe-images')
+
+    print("AN Milk Tea - Image Deduplicator")
+    print("=" * 50)
+
+    mappings = read_mappings()
+    references: Dict[str, int] = {}
+    for mapping in mappings.values():
+        for url in mapping.values():
+            references[url] = references.get(url, 0) + 1
+
+    paths: Dict[str, Path] = {}
+    for source_dir in SOURCE_DIRS:
+        for path in sorted(source_dir.glob('*.jpg')):
+            if not path.name.startswith('.'):
+                paths[public_url(path)] = path
+
+    # Most-referenced files first, so they become the canonical copy of their group;
+    # then product images before menu crops, then the largest file
+    order = sorted(paths, key=lambda url: (-references.get(url, 0), '/menu-extracted/' in url,
+                                           -paths[url].stat().st_size, url))
+    with trace.span('hash', count=len(order)):
+        hashes = {url: image_hash(paths[url]) for url in order}
+    print(f"Images: {len(hashes)}  Threshold: {args.threshold} bits  Color tolerance: {args.color_tolerance}")
+
+    with trace.span('group'):
+        groups = near_duplicate_groups(hashes, args.threshold, args.color_tolerance)
+
+    aliases: Dict[str, str] = {}
+    report: List[dict] = []
+    for group in groups:
+        canonical, members = group[0], group[1:]
+        print(f"\n  {canonical}")
+        entry = {'canonical': canonical, 'aliases': []}
+        for url in members:
+            aliases[url] = canonical
+            distance = hamming(hashes[canonical].phash, hashes[url].phash)
+            color = round(hashes[canonical].color_distance(hashes[url]), 2)
+            entry['aliases'].append({'url': url, 'phash_distance': distance, 'color_distance': color})
+            print(f"    = {url} (pHash {distance}, color {color})")
+        report.append(entry)
+
+    # Files an earlier --apply deleted are no longer hashed; keep their aliases,
+    # pointing at their group's current canonical file
+    deleted = {url: canonical for url, canonical in load_aliases().items()
+               if url not in paths and url not in aliases}
+    for url, canonical in deleted.items():
+        aliases[url] = aliases.get(canonical, canonical)
+
+    rewritten = {
+        name: {key: aliases.get(url, url) for key, url in mapping.items()}
+        for name, mapping in mappings.items()
+    }
+    changed = sum(1 for mapping in mappings.values() for url in mapping.values() if url in aliases)
+
+    atomic_write_text(OUTPUT_PATH, json.dumps(dict(sorted(aliases.items())), indent=2, ensure_ascii=False) + '\n')
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(REPORT_PATH, json.dumps({
+        'threshold': args.threshold,
+        'colorTolerance': args.color_tolerance,
+        'aliases': dict(sorted(aliases.items())),
+        'groups': report,
+        'mappings': rewritten,
+    }, indent=2, ensure_ascii=False) + '\n')
+
+    removed = 0
+    saved = 0
+    if args.apply:
+        manifests: Dict[Path, Manifest] = {}
+        for url in aliases:
+            if url in deleted:
+                continue
+            path = paths[url]
+            manifest = manifests.setdefault(path.parent, Manifest(path.parent))
+            saved += path.stat().st_size
+            path.unlink()
+            manifest.forget(path)
+            removed += 1
+        for manifest in manifests.values():
+            manifest.save()
+
+    print("\n" + "=" * 50)
+    print(f"Groups: {len(groups)}")
+    print(f"Aliases: {len(aliases) - len(deleted)} of {len(hashes)} images")
+    if deleted:
+        print(f"Kept from earlier --apply: {len(deleted)}")
+    print(f"Mapping entries rewritten: {changed}")
+    if args.apply:
+        print(f"Deleted: {removed} files ({saved // 1024} KB)")
+    print(f"Output: {OUTPUT_PATH}")
+    print(f"Report: {REPORT_PATH}")
+
+
+if __name__ == '__main__':
+    main()
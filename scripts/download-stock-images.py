@@ -3,15 +3,24 @@
 """
 Download stock images for AN Milk Tea menu from Unsplash.
 Using free stock photos that match bubble tea aesthetic.
+Each unique URL is fetched once over pooled keep-alive connections, then
+copied to every product that uses it. Downloads are kept in an HTTP cache
+and revalidated with ETag / Last-Modified, so unchanged images cost a 304.
 """
 
 import os
 import sys
 import io
-import time
-import urllib.request
-import ssl
+import argparse
 from pathlib import Path
+from typing import Dict, List
+
+from an_assets.cache import cache_key
+from an_assets.catalog import load_catalog
+from an_assets.download import (DEFAULT_WORKERS, MAX_DOWNLOAD_BYTES, ConnectionPool, HttpCache, fetch_all,
+                                link_or_copy)
+from an_assets.manifest import Manifest
+from an_assets import trace
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -21,126 +30,111 @@ if sys.platform == 'win32':
 # Output directory
 OUTPUT_DIR = Path(__file__).parent.parent / 'public' / 'images' / 'products'
 
-# Unsplash image URLs for bubble tea related images
-# Using direct links from unsplash with size parameters
-STOCK_IMAGES = {
-    # Category defaults - use high quality bubble tea images
-    'tra-sua-default': 'https://images.unsplash.com/photo-1558857563-b371033873b8?w=600&h=600&fit=crop',
-    'tra-trai-cay-default': 'https://images.unsplash.com/photo-1556679343-c7306c1976bc?w=600&h=600&fit=crop',
-    'latte-default': 'https://images.unsplash.com/photo-1461023058943-07fcbe16d735?w=600&h=600&fit=crop',
-    'sua-tuoi-default': 'https://images.unsplash.com/photo-1550583724-b2692b85b150?w=600&h=600&fit=crop',
-    'yaourt-default': 'https://images.unsplash.com/photo-1488477181946-6428a0291777?w=600&h=600&fit=crop',
-    'tra-12k-default': 'https://images.unsplash.com/photo-1499638673689-79a0b5115d87?w=600&h=600&fit=crop',
-    'tra-bi-dao-default': 'https://images.unsplash.com/photo-1544787219-7f47ccb76574?w=600&h=600&fit=crop',
-
-    # Tra Sua variations
-    'tra-sua': 'https://images.unsplash.com/photo-1558857563-b371033873b8?w=600&h=600&fit=crop',
-    'tra-sua-tc-trang': 'https://images.unsplash.com/photo-1525385133512-2f3bdd039054?w=600&h=600&fit=crop',
-    'tra-sua-tc-den': 'https://images.unsplash.com/photo-1558857563-b371033873b8?w=600&h=600&fit=crop',
-    'tra-sua-tc-hoang-kim': 'https://images.unsplash.com/photo-1541696490-8744a5dc0228?w=600&h=600&fit=crop',
-    'tra-sua-socola': 'https://images.unsplash.com/photo-1572490122747-3968b75cc699?w=600&h=600&fit=crop',
-    'tra-sua-cacao': 'https://images.unsplash.com/photo-1517701604599-bb29b565090c?w=600&h=600&fit=crop',
-    'tra-sua-full-topping': 'https://images.unsplash.com/photo-1558857563-b371033873b8?w=600&h=600&fit=crop',
-    'tra-sua-lai': 'https://images.unsplash.com/photo-1576092768241-dec231879fc3?w=600&h=600&fit=crop',
-    'tra-sua-lai-vai': 'https://images.unsplash.com/photo-1576092768241-dec231879fc3?w=600&h=600&fit=crop',
-
-    # Tra Trai Cay
-    'tra-xanh-xoai': 'https://images.unsplash.com/photo-1556679343-c7306c1976bc?w=600&h=600&fit=crop',
-    'tra-xanh-dao': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=600&h=600&fit=crop',
-    'tra-xanh-vai': 'https://images.unsplash.com/photo-1556679343-c7306c1976bc?w=600&h=600&fit=crop',
-    'tra-dao-xoai': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=600&h=600&fit=crop',
-    'tra-dao-vai': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=600&h=600&fit=crop',
-    'tra-vai-xoai': 'https://images.unsplash.com/photo-1556679343-c7306c1976bc?w=600&h=600&fit=crop',
-    'tra-sen-vang': 'https://images.unsplash.com/photo-1499638673689-79a0b5115d87?w=600&h=600&fit=crop',
-
-    # Tra Dong Gia 12K
-    'tra-xanh': 'https://images.unsplash.com/photo-1556679343-c7306c1976bc?w=600&h=600&fit=crop',
-    'tra-xanh-chanh': 'https://images.unsplash.com/photo-1499638673689-79a0b5115d87?w=600&h=600&fit=crop',
-    'tra-tac': 'https://images.unsplash.com/photo-1499638673689-79a0b5115d87?w=600&h=600&fit=crop',
-    'tra-dao': 'https://images.unsplash.com/photo-1544145945-f90425340c7e?w=600&h=600&fit=crop',
-
-    # Tra Bi Dao
-    'tra-bi-dao': 'https://images.unsplash.com/photo-1544787219-7f47ccb76574?w=600&h=600&fit=crop',
-    'tra-xanh-bi-dao': 'https://images.unsplash.com/photo-1544787219-7f47ccb76574?w=600&h=600&fit=crop',
-
-    # Latte
-    'latte-matcha': 'https://images.unsplash.com/photo-1515823064-d6e0c04616a7?w=600&h=600&fit=crop',
-    'latte-socola': 'https://images.unsplash.com/photo-1461023058943-07fcbe16d735?w=600&h=600&fit=crop',
-    'latte-khoai-mon': 'https://images.unsplash.com/photo-1597318181409-cf64d0b5d8a2?w=600&h=600&fit=crop',
-    'latte-cacao': 'https://images.unsplash.com/photo-1517701604599-bb29b565090c?w=600&h=600&fit=crop',
-
-    # Sua Tuoi
-    'sua-tuoi-matcha': 'https://images.unsplash.com/photo-1515823064-d6e0c04616a7?w=600&h=600&fit=crop',
-    'sua-tuoi-socola': 'https://images.unsplash.com/photo-1572490122747-3968b75cc699?w=600&h=600&fit=crop',
-    'sua-tuoi-khoai-mon': 'https://images.unsplash.com/photo-1597318181409-cf64d0b5d8a2?w=600&h=600&fit=crop',
-    'sua-tuoi-duong-den': 'https://images.unsplash.com/photo-1541696490-8744a5dc0228?w=600&h=600&fit=crop',
-    'sua-tuoi-tran-chau': 'https://images.unsplash.com/photo-1550583724-b2692b85b150?w=600&h=600&fit=crop',
-
-    # Yaourt
-    'yaourt-da': 'https://images.unsplash.com/photo-1488477181946-6428a0291777?w=600&h=600&fit=crop',
-    'yaourt-dau': 'https://images.unsplash.com/photo-1505252585461-04db1eb84625?w=600&h=600&fit=crop',
-    'yaourt-viet-quat': 'https://images.unsplash.com/photo-1553530666-ba11a7da3888?w=600&h=600&fit=crop',
-    'yaourt-tc-duong-den': 'https://images.unsplash.com/photo-1488477181946-6428a0291777?w=600&h=600&fit=crop',
-}
-
-
-def download_image(url: str, output_path: Path) -> bool:
-    """Download image from URL."""
-    try:
-        # Create SSL context that doesn't verify certificates (for development)
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-
-        req = urllib.request.Request(url, headers=headers)
-
-        with urllib.request.urlopen(req, context=ctx, timeout=30) as response:
-            data = response.read()
-
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(output_path, 'wb') as f:
-                f.write(data)
-
-            return True
-
-    except Exception as e:
-        print(f"  [ERROR] {e}")
-        return False
+# Name recorded in the build manifest for outputs written by this script
+BUILDER = 'download-stock-images'
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download stock images for AN Milk Tea menu.")
+    parser.add_argument('--force', action='store_true',
+                        help="Download every image unconditionally, even if it exists or is up to date")
+    parser.add_argument('--offline', action='store_true',
+                        help="Don't revalidate URLs whose images are all up to date")
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_WORKERS, metavar='N',
+                        help=f"Parallel downloads (default {DEFAULT_WORKERS})")
+    parser.add_argument('--max-size', type=float, default=MAX_DOWNLOAD_BYTES / 2 ** 20, metavar='MB',
+                        help=f"Reject downloads larger than this (default {MAX_DOWNLOAD_BYTES // 2 ** 20} MB)")
+    parser.add_argument('--hardlink', action='store_true',
+                        help="Hardlink products to the download cache instead of copying (later scripts "
+                             "replace products by rename, so the cache is never written through)")
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help="Only build products whose code matches this glob, e.g. 'tra-sua*'; repeatable")
+    trace.add_arguments(parser)
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    trace.start(args, BUILDER)
+
+    # Unsplash photos, sized 600x600 through URL parameters
+    products = load_catalog().select(args.only).with_stock()
+
     print(f"Output directory: {OUTPUT_DIR}")
-    print(f"Total images: {len(STOCK_IMAGES)}")
+    print(f"Total images: {len(products)}")
     print("=" * 50)
 
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(OUTPUT_DIR)
 
     success = 0
     failed = 0
     skipped = 0
 
-    for name, url in STOCK_IMAGES.items():
-        output_path = OUTPUT_DIR / f"{name}.jpg"
+    # {url: output paths of every product that uses it}
+    groups: Dict[str, List[Path]] = {}
+    for product in products:
+        name, url = product.code, product.stock_url
+        output_path = OUTPUT_DIR / product.filename
 
-        if output_path.exists():
+        # Keep images other scripts built
+        if not args.force and output_path.exists() and not manifest.owned_by(output_path, BUILDER):
             print(f"  [SKIP] {name}.jpg exists")
             skipped += 1
             continue
 
-        print(f"  Downloading: {name}.jpg...")
-
-        if download_image(url, output_path):
-            print(f"  [OK] {name}.jpg")
-            success += 1
-        else:
-            failed += 1
-
-        # Small delay between requests
-        time.sleep(0.5)
+        groups.setdefault(url, []).append(output_path)
+
+    def is_current(output_path: Path, url: str, sha256: str) -> bool:
+        return (manifest.is_fresh(output_path, BUILDER, cache_key(url))
+                and manifest.entry(output_path).get('sha256') == sha256)
+
+    urls = list(groups)
+    if args.offline and not args.force:
+        urls = [url for url in urls
+                if not all(manifest.is_fresh(path, BUILDER, cache_key(url)) for path in groups[url])]
+        skipped += sum(len(groups[url]) for url in groups if url not in urls)
+
+    http_cache = HttpCache()
+    not_modified = 0
+    if urls:
+        print(f"\n[FETCHING] {len(urls)} unique URLs for {sum(len(groups[url]) for url in urls)} images, "
+              f"{args.jobs} parallel")
+        pool = ConnectionPool()
+        try:
+            for result in fetch_all(urls, http_cache, workers=args.jobs, pool=pool, conditional=not args.force,
+                                    max_bytes=int(args.max_size * 2 ** 20)):
+                paths = groups[result.url]
+                if not result.ok:
+                    print(f"  [ERROR] {', '.join(path.name for path in paths)}: {result.error}")
+                    failed += len(paths)
+                    continue
+
+                if not result.changed:
+                    not_modified += 1
+                source = http_cache.entry(result.url)
+                sha256 = source['sha256']
+                for output_path in paths:
+                    if not args.force and is_current(output_path, result.url, sha256):
+                        print(f"  [SKIP] {output_path.name} up to date")
+                        skipped += 1
+                        continue
+                    try:
+                        with trace.span('copy', code=output_path.stem):
+                            link_or_copy(result.body_path, output_path, args.hardlink)
+                    except OSError as e:
+                        print(f"  [ERROR] {output_path.name}: {e}")
+                        failed += 1
+                        continue
+                    print(f"  [OK] {output_path.name}")
+                    manifest.record(output_path, BUILDER, cache_key(result.url), url=result.url,
+                                    source_sha256=sha256, etag=source.get('etag'))
+                    success += 1
+        finally:
+            pool.close()
+            http_cache.save()
+        print(f"  {pool.requests} requests over {pool.connects} connections, {not_modified} not modified")
+
+    manifest.save()
 
     print("\n" + "=" * 50)
     print(f"Success: {success}")
@@ -5,9 +5,13 @@ Extract drink images from AN Milk Tea menu.
 Uses bounding box coordinates from Gemini analysis.
 """
 
+import os
 import sys
 import io
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -15,16 +19,34 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 try:
+    import numpy
     from PIL import Image
 except ImportError:
-    print("Error: Pillow not installed")
-    print("Install with: pip install Pillow")
+    print("Error: Pillow / numpy not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
     sys.exit(1)
 
+from an_assets.cache import cache_key
+from an_assets.catalog import selected
+from an_assets.encode import targeted_jpeg
+from an_assets.files import atomic_write_bytes, atomic_writer
+from an_assets.manifest import Manifest
+from an_assets.regions import percent_box, read_regions
+from an_assets import trace
+
 # Paths
 MENU_IMAGE = Path(__file__).parent.parent / 'public' / 'images' / 'menu-an.jpg'
 OUTPUT_DIR = Path(__file__).parent.parent / 'public' / 'images' / 'menu-extracted'
 
+# Size and quality of every extracted drink image
+OUTPUT_SIZE = (600, 600)
+JPEG_QUALITY = 92
+CROP_PADDING = 5
+
+# Name recorded in the build manifest; bump EXTRACT_VERSION when crop output changes
+BUILDER = 'extract-menu-images'
+EXTRACT_VERSION = 1
+
 # Drink photos from Gemini analysis (bbox as percentage: left%, top%, right%, bottom%)
 # Manually adjusted based on visual inspection
 DRINK_PHOTOS = [
@@ -60,7 +82,36 @@ DRINK_PHOTOS = [
 ]
 
 
-def extract_drink_image(menu_img: Image.Image, bbox_percent: list, output_path: Path, padding: int = 5) -> bool:
+def save_drink_crop(cropped: Image.Image, output_path: Path, target_ssim: Optional[float] = None) -> None:
+    """
+    Resize a crop to 600x600, flatten to RGB and save it as JPEG, at
+    JPEG_QUALITY or at the lowest quality that reaches target_ssim.
+    """
+    # Resize to square 600x600 for consistency
+    with trace.span('resize'):
+        cropped = cropped.resize(OUTPUT_SIZE, Image.Resampling.LANCZOS)
+
+    # Convert RGBA to RGB if needed
+    if cropped.mode == 'RGBA':
+        background = Image.new('RGB', cropped.size, (255, 255, 255))
+        background.paste(cropped, mask=cropped.split()[3])
+        cropped = background
+    elif cropped.mode != 'RGB':
+        cropped = cropped.convert('RGB')
+
+    # Save
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with trace.span('encode'):
+        if target_ssim:
+            data, _, _ = targeted_jpeg(cropped, target_ssim)
+            atomic_write_bytes(output_path, data)
+        else:
+            with atomic_writer(output_path) as f:
+                cropped.save(f, 'JPEG', quality=JPEG_QUALITY)
+
+
+def extract_drink_image(menu_img: Image.Image, bbox_percent: list, output_path: Path, padding: int = CROP_PADDING,
+                        target_ssim: Optional[float] = None) -> bool:
     """
     Extract a drink image from the menu using percentage-based bounding box.
 
@@ -69,47 +120,78 @@ def extract_drink_image(menu_img: Image.Image, bbox_percent: list, output_path:
         bbox_percent: [left%, top%, right%, bottom%] as percentages
         output_path: Path to save extracted image
         padding: Extra padding in pixels around the crop
+        target_ssim: Search JPEG quality for this SSIM instead of JPEG_QUALITY
     """
-    width, height = menu_img.size
-
-    # Convert percentage to pixels
-    left = int(width * bbox_percent[0] / 100) - padding
-    top = int(height * bbox_percent[1] / 100) - padding
-    right = int(width * bbox_percent[2] / 100) + padding
-    bottom = int(height * bbox_percent[3] / 100) + padding
-
-    # Clamp to image bounds
-    left = max(0, left)
-    top = max(0, top)
-    right = min(width, right)
-    bottom = min(height, bottom)
+    box = percent_box(menu_img.size, bbox_percent, padding)
 
     try:
         # Crop the image
-        cropped = menu_img.crop((left, top, right, bottom))
-
-        # Resize to square 600x600 for consistency
-        cropped = cropped.resize((600, 600), Image.Resampling.LANCZOS)
-
-        # Convert RGBA to RGB if needed
-        if cropped.mode == 'RGBA':
-            background = Image.new('RGB', cropped.size, (255, 255, 255))
-            background.paste(cropped, mask=cropped.split()[3])
-            cropped = background
-        elif cropped.mode != 'RGB':
-            cropped = cropped.convert('RGB')
-
-        # Save
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        cropped.save(output_path, 'JPEG', quality=92)
-
+        save_drink_crop(menu_img.crop(box), output_path, target_ssim)
         return True
     except Exception as e:
         print(f"  [ERROR] {e}")
         return False
 
 
+def extract_drinks_tiled(menu_path: Path, menu_size: tuple, drinks: List[dict], output_dir: Path,
+                         target_ssim: Optional[float] = None) -> Iterator[Tuple[dict, bool]]:
+    """
+    Extract drinks from a JPEG menu file, decoding it once per draft scale
+    (see read_regions()) instead of at full size. Yields (drink, saved) as
+    each crop is written.
+    """
+    boxes = [percent_box(menu_size, drink['bbox'], CROP_PADDING) for drink in drinks]
+    for index, cropped in read_regions(menu_path, boxes, OUTPUT_SIZE):
+        drink = drinks[index]
+        with trace.span('product', code=drink['name']):
+            try:
+                save_drink_crop(cropped, output_dir / f"{drink['name']}.jpg", target_ssim)
+                yield drink, True
+            except Exception as e:
+                print(f"  [ERROR] {e}")
+                yield drink, False
+
+
+def extract_drink(menu_img: Image.Image, drink: dict, output_path: Path,
+                  target_ssim: Optional[float] = None) -> bool:
+    """Extract one DRINK_PHOTOS entry from the decoded menu."""
+    with trace.span('product', code=drink['name']):
+        return extract_drink_image(menu_img, drink['bbox'], output_path, target_ssim=target_ssim)
+
+
+def crop_params(drink: dict, tiled: bool, target_ssim: Optional[float] = None) -> str:
+    """Manifest parameter hash for one crop: bbox, output settings and decode mode."""
+    parts = [EXTRACT_VERSION, drink['bbox'], CROP_PADDING, OUTPUT_SIZE, JPEG_QUALITY, tiled]
+    if target_ssim:
+        parts.append(('ssim', target_ssim))
+    return cache_key(*parts)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract drink images from AN Milk Tea menu.")
+    parser.add_argument('--tiled', action='store_true',
+                        help="For JPEG posters, decode at the draft scale the crops need instead of full size, "
+                             "once per scale; crops are saved one at a time, so --jobs is ignored")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-extract every drink, even if the manifest says it is up to date")
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+                        help="Crops to resize/encode in parallel threads (0 = one per CPU, default 1)")
+    parser.add_argument('--target-ssim', type=float, metavar='SSIM',
+                        help="Encode each crop at the lowest JPEG quality that keeps this SSIM against the "
+                             "lossless crop (e.g. 0.99) instead of a fixed quality")
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help="Only extract drinks whose name matches this glob, e.g. 'tra-sua*'; repeatable")
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+
 def main():
+    args = parse_args()
+    trace.start(args, BUILDER)
+
     print("AN Milk Tea - Menu Image Extractor")
     print("=" * 50)
 
@@ -118,10 +200,19 @@ def main():
         print(f"ERROR: Menu image not found: {MENU_IMAGE}")
         return
 
-    # Load menu image
+    # Open menu image (pixels are decoded on first crop)
     menu_img = Image.open(MENU_IMAGE)
     width, height = menu_img.size
-    print(f"Menu image: {width}x{height}")
+    if args.tiled and menu_img.format != 'JPEG':
+        # Only JPEG can decode at reduced scale; anything else is decoded once in full
+        print(f"Note: --tiled only applies to JPEG posters; decoding the {menu_img.format} poster once")
+        args.tiled = False
+    if args.tiled and args.jobs > 1:
+        # Crops are saved as each shared decode yields them, so only one
+        # decode and one crop are held at a time
+        print("Note: --tiled saves one crop at a time, ignoring --jobs")
+        args.jobs = 1
+    print(f"Menu image: {width}x{height}{' (tiled)' if args.tiled else ''}")
     print(f"Output directory: {OUTPUT_DIR}")
     print(f"Total drinks to extract: {len(DRINK_PHOTOS)}")
     print("=" * 50)
@@ -131,26 +222,55 @@ def main():
 
     success = 0
     failed = 0
+    skipped = 0
 
+    # Only crops whose bbox, settings or source poster changed are re-extracted
+    manifest = Manifest(OUTPUT_DIR)
+    pending = []
     for drink in DRINK_PHOTOS:
-        name = drink['name']
-        bbox = drink['bbox']
-        drink_type = drink['type']
-
-        output_path = OUTPUT_DIR / f"{name}.jpg"
-
-        print(f"  Extracting: {name} ({drink_type})")
-        print(f"    BBox: {bbox}%")
-
-        if extract_drink_image(menu_img, bbox, output_path):
-            print(f"    [OK] Saved: {output_path.name}")
-            success += 1
+        if not selected(drink['name'], args.only):
+            continue
+        output_path = OUTPUT_DIR / f"{drink['name']}.jpg"
+        if not args.force and manifest.is_fresh(output_path, BUILDER, crop_params(drink, args.tiled, args.target_ssim), [MENU_IMAGE]):
+            print(f"  [SKIP] {drink['name']}.jpg up to date")
+            skipped += 1
+            continue
+        pending.append(drink)
+
+    if pending and not args.tiled:
+        # Decode the poster once; worker threads only crop from the shared pixels
+        with trace.span('decode', size=[width, height]):
+            menu_img.load()
+
+    # Resize and JPEG encode release the GIL, so crops run concurrently in threads
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        if args.tiled:
+            results = extract_drinks_tiled(MENU_IMAGE, menu_img.size, pending, OUTPUT_DIR, args.target_ssim)
         else:
-            failed += 1
+            futures = {
+                pool.submit(extract_drink, menu_img, drink, OUTPUT_DIR / f"{drink['name']}.jpg",
+                            args.target_ssim): drink
+                for drink in pending
+            }
+            results = ((futures[future], future.result()) for future in as_completed(futures))
+
+        for drink, saved in results:
+            print(f"  Extracted: {drink['name']} ({drink['type']})  BBox: {drink['bbox']}%")
+
+            if saved:
+                print(f"    [OK] Saved: {drink['name']}.jpg")
+                manifest.record(OUTPUT_DIR / f"{drink['name']}.jpg", BUILDER,
+                                crop_params(drink, args.tiled, args.target_ssim), [MENU_IMAGE])
+                success += 1
+            else:
+                failed += 1
+
+    manifest.save()
 
     print("\n" + "=" * 50)
     print(f"Success: {success}")
     print(f"Failed: {failed}")
+    print(f"Skipped: {skipped}")
     print(f"Output: {OUTPUT_DIR}")
 
     # List which drink types we extracted
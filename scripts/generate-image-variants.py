@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate responsive variants of the AN Milk Tea product images.
+Run after the recolor/extract/generate scripts. Every image gets a width
+ladder (96/192/300/600) under <dir>/variants/, in WebP by default (AVIF
+and JPEG with --formats). src/lib/data/product-image-variants.json maps
+each original image URL to its widths in the client format, WebP when it
+was generated. getImageLoader() in product-images.ts reads it, so
+next/image requests the narrowest variant that fills each srcset width.
+The full index, with every format and file, is kept in
+.cache/an-assets/image-variants.json.
+"""
+
+import os
+import sys
+import io
+import json
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+try:
+    from PIL import Image
+except ImportError:
+    print("Error: Pillow not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
+    sys.exit(1)
+
+from an_assets.cache import CACHE_DIR, cache_key
+from an_assets.catalog import selected
+from an_assets.files import atomic_write_text
+from an_assets.manifest import Manifest
+from an_assets import trace
+from an_assets.variants import (FORMATS, VARIANT_VERSION, WIDTHS, available_formats, encode_all,
+                                ladder, variant_path)
+
+# Paths
+PUBLIC_DIR = Path(__file__).parent.parent / 'public'
+SOURCE_DIRS = [PUBLIC_DIR / 'images' / 'products']
+OUTPUT_PATH = Path(__file__).parent.parent / 'src' / 'lib' / 'data' / 'product-image-variants.json'
+INDEX_PATH = CACHE_DIR / 'image-variants.json'
+
+# A next/image loader returns one URL per width and cannot negotiate the
+# format, so the client index lists the first of these that was generated
+CLIENT_FORMATS = ('webp', 'jpeg')
+DEFAULT_FORMATS = ('webp',)
+
+# Name recorded in the build manifest of each variants folder
+BUILDER = 'generate-image-variants'
+
+
+def public_url(path: Path) -> str:
+    """URL the Next.js app serves a file under public/ at."""
+    return '/' + path.resolve().relative_to(PUBLIC_DIR.resolve()).as_posix()
+
+
+def variant_params(widths: List[int], formats: List[str]) -> str:
+    """Manifest parameter hash shared by every variant."""
+    return cache_key(VARIANT_VERSION, widths, formats, {fmt: FORMATS[fmt] for fmt in formats})
+
+
+def expected_outputs(source: Path, out_dir: Path, widths: List[int], formats: List[str]) -> List[Path]:
+    with Image.open(source) as image:
+        steps = ladder(image.size, widths)
+    return [variant_path(out_dir, source.stem, width, fmt) for width, _ in steps for fmt in formats]
+
+
+def index_entry(size, outputs) -> Dict[str, Any]:
+    """Index record for one source: its size and variants by format, narrowest first."""
+    variants: Dict[str, List[Dict[str, Any]]] = {}
+    for width, _, fmt, path, _ in sorted(outputs, key=lambda output: output[0]):
+        variants.setdefault(fmt, []).append({'width': width, 'src': public_url(path)})
+    return {'width': size[0], 'height': size[1], 'variants': variants}
+
+
+def load_index() -> Dict[str, Any]:
+    if not INDEX_PATH.exists():
+        return {}
+    try:
+        return json.loads(INDEX_PATH.read_text(encoding='utf-8')).get('images', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate responsive AVIF/WebP/JPEG variants of product images.")
+    parser.add_argument('--dir', action='append', type=Path, metavar='DIR',
+                        help="Source image folder; repeatable (default public/images/products)")
+    parser.add_argument('--widths', default=','.join(map(str, WIDTHS)), metavar='LIST',
+                        help=f"Comma-separated widths (default {','.join(map(str, WIDTHS))})")
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS), metavar='LIST',
+                        help=f"Comma-separated formats out of {', '.join(FORMATS)} "
+                             f"(default {','.join(DEFAULT_FORMATS)}); must include webp or jpeg")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-encode every variant, even if the manifest says it is up to date")
+    parser.add_argument('--jobs', '-j', type=int, default=0, metavar='N',
+                        help="Images to encode in parallel processes (0 = one per CPU, default 0)")
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help="Only encode images whose name (without .jpg) matches this glob; repeatable")
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    args.dir = args.dir or SOURCE_DIRS
+    args.widths = sorted({int(width) for width in args.widths.split(',')})
+    args.formats = [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+
+def main():
+    args = parse_args()
+    trace.start(args, BUILDER)
+
+    unknown = [fmt for fmt in args.formats if fmt not in FORMATS]
+    if unknown:
+        print(f"Error: unknown format(s): {', '.join(unknown)}")
+        sys.exit(1)
+    formats = available_formats(args.formats)
+    for fmt in args.formats:
+        if fmt not in formats:
+            print(f"Warning: this Pillow build cannot encode {fmt}; skipping it")
+    client_format = next((fmt for fmt in CLIENT_FORMATS if fmt in formats), None)
+    if client_format is None:
+        print(f"Error: --formats needs one of {', '.join(CLIENT_FORMATS)} for the client index")
+        sys.exit(1)
+
+    print("AN Milk Tea - Image Variant Generator")
+    print(f"Widths: {args.widths}  Formats: {formats}")
+    print("=" * 50)
+
+    index = load_index()
+    params = variant_params(args.widths, formats)
+
+    success = 0
+    failed = 0
+    skipped = 0
+
+    for source_dir in args.dir:
+        out_dir = source_dir / 'variants'
+        manifest = Manifest(out_dir)
+        sources = sorted(path for path in source_dir.glob('*.jpg') if not path.name.startswith('.'))
+        print(f"\n{source_dir}: {len(sources)} images")
+
+        # Drop index entries for images that were removed
+        prefix = public_url(source_dir) + '/'
+        current = {public_url(path) for path in sources}
+        for url in [url for url in index if url.startswith(prefix) and url not in current]:
+            del index[url]
+
+        pending = []
+        for source in sources:
+            if not selected(source.stem, args.only):
+                continue
+            outputs = expected_outputs(source, out_dir, args.widths, formats)
+            if (not args.force and public_url(source) in index
+                    and all(manifest.is_fresh(output, BUILDER, params, [source]) for output in outputs)):
+                skipped += 1
+                continue
+            pending.append(source)
+
+        print(f"  Encoding {len(pending)} images ({skipped} up to date so far), {args.jobs} processes")
+        for result in encode_all(pending, out_dir, args.widths, formats, workers=args.jobs):
+            if not result.ok:
+                print(f"  [ERROR] {result.source.name}: {result.error}")
+                failed += 1
+                continue
+
+            for _, _, _, path, _ in result.outputs:
+                manifest.record(path, BUILDER, params, [result.source])
+            index[public_url(result.source)] = index_entry(result.size, result.outputs)
+
+            total = {fmt: sum(size for _, _, f, _, size in result.outputs if f == fmt) for fmt in formats}
+            print(f"  [OK] {result.source.name}: {len(result.outputs)} files "
+                  f"({', '.join(f'{fmt} {size // 1024} KB' for fmt, size in total.items())})")
+            success += 1
+
+        manifest.save()
+
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(INDEX_PATH, json.dumps({
+        'widths': args.widths,
+        'formats': formats,
+        'images': dict(sorted(index.items())),
+    }, indent=2, ensure_ascii=False) + '\n')
+    atomic_write_text(OUTPUT_PATH, json.dumps({
+        'extension': FORMATS[client_format][1],
+        'images': {
+            url: [variant['width'] for variant in entry['variants'][client_format]]
+            for url, entry in sorted(index.items()) if client_format in entry['variants']
+        },
+    }, indent=2, ensure_ascii=False) + '\n')
+
+    print("\n" + "=" * 50)
+    print(f"Success: {success}")
+    print(f"Failed: {failed}")
+    print(f"Skipped: {skipped}")
+    print(f"Output: {OUTPUT_PATH}")
+    print(f"Index: {INDEX_PATH}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate blur placeholders and dominant colors for AN Milk Tea images.
+Covers public/images/products and public/images/menu-extracted and writes
+src/lib/data/product-placeholders.json, which product-images.ts reads so
+next/image can show placeholder="blur" while the real image loads. That
+file ships to the browser, so it only has the blur data URL and color per
+image; sizes and source hashes for incremental runs are kept in
+.cache/an-assets/placeholders.json.
+"""
+
+import os
+import sys
+import io
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+try:
+    # Only an_assets.placeholders uses Pillow; check for it up front
+    import PIL  # noqa: F401
+except ImportError:
+    print("Error: Pillow not installed")
+    print("Install with: pip install -r scripts/requirements.txt")
+    sys.exit(1)
+
+from an_assets.cache import CACHE_DIR, file_digest
+from an_assets.files import atomic_write_text
+from an_assets.placeholders import PLACEHOLDER_SIZE, placeholder
+from an_assets import trace
+
+# Paths
+PUBLIC_DIR = Path(__file__).parent.parent / 'public'
+SOURCE_DIRS = [
+    PUBLIC_DIR / 'images' / 'products',
+    PUBLIC_DIR / 'images' / 'menu-extracted',
+]
+OUTPUT_PATH = Path(__file__).parent.parent / 'src' / 'lib' / 'data' / 'product-placeholders.json'
+METADATA_PATH = CACHE_DIR / 'placeholders.json'
+
+# Fields the client reads; everything else stays in METADATA_PATH
+CLIENT_FIELDS = ('blurDataURL', 'color')
+
+# Bump whenever placeholder output changes for the same image
+PLACEHOLDER_VERSION = 1
+
+
+def public_url(path: Path) -> str:
+    """URL the Next.js app serves a file under public/ at."""
+    return '/' + path.resolve().relative_to(PUBLIC_DIR.resolve()).as_posix()
+
+
+def load_existing() -> dict:
+    if not METADATA_PATH.exists():
+        return {}
+    try:
+        data = json.loads(METADATA_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != PLACEHOLDER_VERSION:
+        return {}
+    return data.get('images', {})
+
+
+def build_entry(path: Path, sha256: str) -> dict:
+    with trace.span('placeholder', code=path.stem):
+        blur, color, (width, height) = placeholder(path)
+    return {'blurDataURL': blur, 'color': color, 'width': width, 'height': height, 'sha256': sha256}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate blur placeholders and dominant colors for product images.")
+    parser.add_argument('--force', action='store_true',
+                        help="Recompute every placeholder, even for unchanged images")
+    parser.add_argument('--jobs', '-j', type=int, default=0, metavar='N',
+                        help="Images to process in parallel threads (0 = one per CPU, default 0)")
+    trace.add_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+
+def main():
+    args = parse_args()
+    trace.start(args, 'generate-placeholders')
+
+    print("AN Milk Tea - Placeholder Generator")
+    print("=" * 50)
+
+    existing = {} if args.force else load_existing()
+    sources = [
+        path for source_dir in SOURCE_DIRS if source_dir.exists()
+        for path in sorted(source_dir.glob('*.jpg')) if not path.name.startswith('.')
+    ]
+    print(f"Images: {len(sources)}  Placeholder size: {PLACEHOLDER_SIZE}px")
+
+    success = 0
+    failed = 0
+    skipped = 0
+    images = {}
+
+    # Hashing is cheap next to decoding; only changed images are decoded
+    pending = []
+    for path in sources:
+        url = public_url(path)
+        sha256 = file_digest(path)
+        if existing.get(url, {}).get('sha256') == sha256:
+            images[url] = existing[url]
+            skipped += 1
+        else:
+            pending.append((url, path, sha256))
+
+    # Draft decoding and resizing release the GIL, so threads are enough
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {url: pool.submit(build_entry, path, sha256) for url, path, sha256 in pending}
+        for url, future in futures.items():
+            try:
+                images[url] = future.result()
+                print(f"  [OK] {url} {images[url]['color']} ({len(images[url]['blurDataURL'])} chars)")
+                success += 1
+            except Exception as e:
+                print(f"  [ERROR] {url}: {e}")
+                failed += 1
+
+    images = dict(sorted(images.items()))
+    METADATA_PATH.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(METADATA_PATH, json.dumps({
+        'version': PLACEHOLDER_VERSION,
+        'images': images,
+    }, indent=2, ensure_ascii=False) + '\n')
+    atomic_write_text(OUTPUT_PATH, json.dumps({
+        'images': {url: {field: entry[field] for field in CLIENT_FIELDS} for url, entry in images.items()},
+    }, indent=2, ensure_ascii=False) + '\n')
+
+    print("\n" + "=" * 50)
+    print(f"Success: {success}")
+    print(f"Failed: {failed}")
+    print(f"Skipped: {skipped}")
+    print(f"Output: {OUTPUT_PATH}")
+
+
+if __name__ == '__main__':
+    main()
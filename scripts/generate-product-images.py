@@ -7,9 +7,19 @@ All drinks should be in a clear plastic cup with AN logo, top view or 3/4 view.
 
 import os
 import sys
-import time
 import io
+import asyncio
+import argparse
 from pathlib import Path
+from typing import Tuple
+
+from an_assets.cache import CACHE_DIR, cache_key
+from an_assets.catalog import Product, load_catalog
+from an_assets.imagegen import (DEFAULT_CONCURRENCY, DEFAULT_RPM, MAX_ATTEMPTS, PERMANENT,
+                                ImageRequest, generate_all, prompt_digest)
+from an_assets.journal import FAILED, RUNNING, JobJournal
+from an_assets.manifest import Manifest
+from an_assets import trace
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -33,288 +43,25 @@ try:
 except ImportError:
     pass
 
-# Product definitions with prompts
-PRODUCTS = [
-    # === TRÀ SỮA ===
-    {
-        "code": "tra-sua",
-        "name": "Trà Sữa Truyền Thống",
-        "color": "creamy light brown milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-tc-trang",
-        "name": "Trà Sữa Trân Châu Trắng",
-        "color": "creamy light brown milk tea",
-        "toppings": "white tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-tc-den",
-        "name": "Trà Sữa Trân Châu Đen",
-        "color": "creamy brown milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-tc-hoang-kim",
-        "name": "Trà Sữa Trân Châu Hoàng Kim",
-        "color": "creamy golden brown milk tea",
-        "toppings": "golden tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-socola",
-        "name": "Trà Sữa Socola",
-        "color": "rich chocolate brown milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-cacao",
-        "name": "Trà Sữa Cacao",
-        "color": "deep cocoa brown milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-full-topping",
-        "name": "Trà Sữa Full Topping",
-        "color": "creamy brown milk tea",
-        "toppings": "layers of black tapioca pearls, white tapioca pearls, and pudding"
-    },
-    {
-        "code": "tra-sua-lai",
-        "name": "Trà Sữa Lài",
-        "color": "light creamy white-green jasmine milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-sua-lai-vai",
-        "name": "Trà Sữa Lài Vải",
-        "color": "light creamy white-pink lychee jasmine milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-
-    # === TRÀ TRÁI CÂY ===
-    {
-        "code": "tra-xanh-xoai",
-        "name": "Trà Xanh Xoài",
-        "color": "vibrant golden-orange mango green tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-xanh-dao",
-        "name": "Trà Xanh Đào",
-        "color": "soft peachy-pink peach green tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-xanh-vai",
-        "name": "Trà Xanh Vải",
-        "color": "light pink-white lychee green tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-dao-xoai",
-        "name": "Trà Đào Xoài",
-        "color": "gradient peach-orange tropical fruit tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-dao-vai",
-        "name": "Trà Đào Vải",
-        "color": "soft pink peach-lychee fruit tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-vai-xoai",
-        "name": "Trà Vải Xoài",
-        "color": "gradient light pink to golden lychee-mango tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-sen-vang",
-        "name": "Trà Sen Vàng",
-        "color": "golden-amber lotus tea",
-        "toppings": "ice cubes visible"
-    },
-
-    # === TRÀ ĐỒNG GIÁ 12K ===
-    {
-        "code": "tra-xanh",
-        "name": "Trà Xanh",
-        "color": "light green matcha green tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-xanh-chanh",
-        "name": "Trà Xanh Chanh",
-        "color": "light yellow-green lemon green tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-tac",
-        "name": "Trà Tắc",
-        "color": "bright orange kumquat tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-dao",
-        "name": "Trà Đào",
-        "color": "soft peachy-pink peach tea",
-        "toppings": "ice cubes visible"
-    },
-
-    # === TRÀ BÍ ĐAO ===
-    {
-        "code": "tra-bi-dao",
-        "name": "Trà Bí Đao",
-        "color": "light golden-yellow winter melon tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-xanh-bi-dao",
-        "name": "Trà Xanh Bí Đao",
-        "color": "light greenish-yellow winter melon green tea",
-        "toppings": "ice cubes visible"
-    },
-
-    # === LATTE ===
-    {
-        "code": "latte-matcha",
-        "name": "Latte Matcha",
-        "color": "vibrant green matcha latte with white milk layer",
-        "toppings": "cream foam on top"
-    },
-    {
-        "code": "latte-socola",
-        "name": "Latte Socola",
-        "color": "rich chocolate brown latte with white milk layer",
-        "toppings": "cream foam on top"
-    },
-    {
-        "code": "latte-khoai-mon",
-        "name": "Latte Khoai Môn",
-        "color": "purple taro latte with white milk layer",
-        "toppings": "cream foam on top"
-    },
-    {
-        "code": "latte-cacao",
-        "name": "Latte Cacao",
-        "color": "deep cocoa brown latte with white milk layer",
-        "toppings": "cream foam on top"
-    },
-
-    # === SỮA TƯƠI ===
-    {
-        "code": "sua-tuoi-matcha",
-        "name": "Sữa Tươi Matcha",
-        "color": "bright green matcha fresh milk",
-        "toppings": "none, smooth surface"
-    },
-    {
-        "code": "sua-tuoi-socola",
-        "name": "Sữa Tươi Socola",
-        "color": "rich chocolate fresh milk",
-        "toppings": "none, smooth surface"
-    },
-    {
-        "code": "sua-tuoi-khoai-mon",
-        "name": "Sữa Tươi Khoai Môn",
-        "color": "light purple taro fresh milk",
-        "toppings": "none, smooth surface"
-    },
-    {
-        "code": "sua-tuoi-duong-den",
-        "name": "Sữa Tươi Đường Đen",
-        "color": "white fresh milk with dark brown sugar swirls",
-        "toppings": "tiger stripes pattern from brown sugar"
-    },
-    {
-        "code": "sua-tuoi-tran-chau",
-        "name": "Sữa Tươi Trân Châu",
-        "color": "pure white fresh milk",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-
-    # === YAOURT ===
-    {
-        "code": "yaourt-da",
-        "name": "Yaourt Đá",
-        "color": "creamy white yogurt drink",
-        "toppings": "crushed ice visible"
-    },
-    {
-        "code": "yaourt-dau",
-        "name": "Yaourt Dâu",
-        "color": "pink strawberry yogurt drink",
-        "toppings": "crushed ice visible"
-    },
-    {
-        "code": "yaourt-viet-quat",
-        "name": "Yaourt Việt Quất",
-        "color": "deep purple blueberry yogurt drink",
-        "toppings": "crushed ice visible"
-    },
-    {
-        "code": "yaourt-tc-duong-den",
-        "name": "Yaourt Trân Châu Đường Đen",
-        "color": "creamy white yogurt with brown sugar swirls",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-]
-
-# Default category images
-CATEGORY_DEFAULTS = [
-    {
-        "code": "tra-sua-default",
-        "name": "Trà Sữa (Default)",
-        "color": "creamy brown milk tea",
-        "toppings": "black tapioca pearls at the bottom"
-    },
-    {
-        "code": "tra-trai-cay-default",
-        "name": "Trà Trái Cây (Default)",
-        "color": "colorful tropical fruit tea with orange and pink gradient",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "latte-default",
-        "name": "Latte (Default)",
-        "color": "creamy coffee latte with milk layer",
-        "toppings": "cream foam on top"
-    },
-    {
-        "code": "sua-tuoi-default",
-        "name": "Sữa Tươi (Default)",
-        "color": "pure white fresh milk",
-        "toppings": "none, smooth surface"
-    },
-    {
-        "code": "yaourt-default",
-        "name": "Yaourt (Default)",
-        "color": "creamy white yogurt drink",
-        "toppings": "crushed ice visible"
-    },
-    {
-        "code": "tra-12k-default",
-        "name": "Trà Đồng Giá 12K (Default)",
-        "color": "light refreshing tea",
-        "toppings": "ice cubes visible"
-    },
-    {
-        "code": "tra-bi-dao-default",
-        "name": "Trà Bí Đao (Default)",
-        "color": "light golden winter melon tea",
-        "toppings": "ice cubes visible"
-    },
-]
-
-
-def generate_prompt(product: dict) -> str:
+# Imagen model and request settings; part of each image's manifest parameters
+IMAGEN_MODEL = 'imagen-3.0-generate-002'
+ASPECT_RATIO = '1:1'
+SAFETY_FILTER_LEVEL = 'BLOCK_MEDIUM_AND_ABOVE'
+
+# Name recorded in the build manifest for outputs written by this script
+BUILDER = 'generate-product-images'
+
+# Per-product status of the last runs, used to resume after a crash
+JOURNAL_PATH = CACHE_DIR / 'journal' / f'{BUILDER}.jsonl'
+
+def generate_prompt(product: Product) -> str:
     """Generate the image prompt for a product."""
     return f"""Create a professional product photo of a Vietnamese bubble tea drink.
 
 DRINK DETAILS:
-- Name: {product['name']}
-- Color/Appearance: {product['color']}
-- Toppings: {product['toppings']}
+- Name: {product.name}
+- Color/Appearance: {product.color}
+- Toppings: {product.toppings}
 
 REQUIREMENTS:
 - Clear plastic cup with dome lid, branded with "AN" logo
@@ -329,45 +76,109 @@ REQUIREMENTS:
 STYLE: Modern Asian bubble tea shop product photography, Instagram-worthy, clean and minimal aesthetic."""
 
 
-def generate_image(client: genai.Client, prompt: str, output_path: Path, verbose: bool = True) -> bool:
-    """Generate a single image using Gemini Imagen 3."""
-    try:
-        if verbose:
-            print(f"  Generating: {output_path.name}...")
-
-        # Use Imagen 3 for image generation
-        response = client.models.generate_images(
-            model='imagen-3.0-generate-002',
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=1,
-                aspect_ratio='1:1',
-                safety_filter_level='BLOCK_MEDIUM_AND_ABOVE'
-            )
-        )
-
-        # Extract and save image from Imagen response
-        if hasattr(response, 'generated_images') and response.generated_images:
-            image = response.generated_images[0]
-            if hasattr(image, 'image') and hasattr(image.image, 'image_bytes'):
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(output_path, 'wb') as f:
-                    f.write(image.image.image_bytes)
-                if verbose:
-                    print(f"  [OK] Saved: {output_path}")
-                return True
-
-        if verbose:
-            print(f"  [FAIL] No image in response")
+def image_config() -> 'types.GenerateImagesConfig':
+    """Imagen request settings shared by every product."""
+    return types.GenerateImagesConfig(
+        number_of_images=1,
+        aspect_ratio=ASPECT_RATIO,
+        safety_filter_level=SAFETY_FILTER_LEVEL
+    )
+
+
+def prompt_params(prompt: str) -> str:
+    """Manifest parameter hash for one generated image."""
+    return cache_key(IMAGEN_MODEL, ASPECT_RATIO, SAFETY_FILTER_LEVEL, prompt)
+
+
+def needs_generation(manifest: Manifest, journal: JobJournal, output_path: Path, prompt: str,
+                     args: argparse.Namespace) -> bool:
+    """
+    True if the image is missing, or was generated from a different prompt
+    or model. Existing images not generated by this script are kept, unless
+    the journal shows this script was writing them when a run was killed.
+    Prompts that failed permanently last time are not retried unless
+    --retry-failed is given or the prompt changed.
+    """
+    if args.force:
+        return True
+    if manifest.is_fresh(output_path, BUILDER, prompt_params(prompt)):
+        print(f"  [SKIP] Up to date: {output_path.stem}")
         return False
 
-    except Exception as e:
-        if verbose:
-            print(f"  [ERROR] {e}")
+    code = output_path.stem
+    record = journal.get(code) or {}
+    if record.get('status') == RUNNING:
+        print(f"  [RESUME] Interrupted last run: {code}")
+        return True
+    if output_path.exists() and not manifest.owned_by(output_path, BUILDER):
+        print(f"  [SKIP] Exists: {code}")
         return False
+    if (record.get('status') == FAILED and record.get('error_class') == PERMANENT
+            and record.get('prompt') == prompt_digest(prompt) and not args.retry_failed):
+        print(f"  [SKIP] Failed permanently: {code} ({record.get('error')})")
+        return False
+    return True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate product images for AN Milk Tea menu using Gemini API.")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenerate every image, even if it exists or is up to date")
+    parser.add_argument('--concurrency', '-c', type=int, default=DEFAULT_CONCURRENCY, metavar='N',
+                        help=f"Requests in flight at once (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--rpm', type=float, default=DEFAULT_RPM, metavar='N',
+                        help=f"Maximum requests per minute; halved on 429 responses (default {DEFAULT_RPM})")
+    parser.add_argument('--attempts', type=int, default=MAX_ATTEMPTS, metavar='N',
+                        help=f"Attempts per image for rate-limit and transient errors (default {MAX_ATTEMPTS})")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Retry images that failed permanently in an earlier run")
+    parser.add_argument('--only', action='append', metavar='PATTERN',
+                        help="Only build products whose code matches this glob, e.g. 'tra-sua*'; repeatable")
+    trace.add_arguments(parser)
+    return parser.parse_args()
+
+
+async def generate_missing(client, output_dir: Path, args: argparse.Namespace) -> Tuple[int, int]:
+    """
+    Generate every stale category default and product image concurrently.
+    client may be a genai.Client or any fake with the same generate_images API.
+    Returns (success, failed).
+    """
+    manifest = Manifest(output_dir)
+    journal = JobJournal(JOURNAL_PATH)
+    success = 0
+    failed = 0
+
+    # Category defaults are queued first
+    requests = []
+    for product in sorted(load_catalog().select(args.only).with_prompt(), key=lambda p: not p.is_default):
+        output_path = output_dir / product.filename
+        prompt = generate_prompt(product)
+        if needs_generation(manifest, journal, output_path, prompt, args):
+            requests.append(ImageRequest(product.code, prompt, output_path))
+
+    print(f"\n[GENERATING] {len(requests)} images, {args.concurrency} concurrent, {args.rpm:g} rpm")
+    async for result in generate_all(client, requests, IMAGEN_MODEL, image_config(),
+                                     concurrency=args.concurrency, rpm=args.rpm,
+                                     max_attempts=args.attempts, journal=journal):
+        request = result.request
+        if result.ok:
+            print(f"  [OK] Saved: {request.output_path.name} (attempts: {result.attempts})")
+            manifest.record(request.output_path, BUILDER, prompt_params(request.prompt))
+            success += 1
+        else:
+            print(f"  [ERROR] {request.code} ({result.error_class}, attempts: {result.attempts}): {result.error}")
+            failed += 1
+
+    manifest.save()
+    journal.compact()
+    return success, failed
 
 
 def main():
+    args = parse_args()
+    trace.start(args, BUILDER)
+
     # Get API key
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
@@ -379,53 +190,17 @@ def main():
     output_dir = Path(__file__).parent.parent / 'public' / 'images' / 'products'
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    products = load_catalog().select(args.only).with_prompt()
+    defaults = sum(1 for product in products if product.is_default)
     print(f"Output directory: {output_dir}")
-    print(f"Total products: {len(PRODUCTS)}")
-    print(f"Category defaults: {len(CATEGORY_DEFAULTS)}")
+    print(f"Total products: {len(products) - defaults}")
+    print(f"Category defaults: {defaults}")
     print("=" * 50)
 
     # Initialize client
     client = genai.Client(api_key=api_key)
 
-    # Track results
-    success = 0
-    failed = 0
-
-    # Generate category defaults first
-    print("\n[CATEGORIES] Generating category default images...")
-    for product in CATEGORY_DEFAULTS:
-        output_path = output_dir / f"{product['code']}.jpg"
-        if output_path.exists():
-            print(f"  [SKIP] Exists: {product['code']}")
-            continue
-
-        prompt = generate_prompt(product)
-        if generate_image(client, prompt, output_path):
-            success += 1
-        else:
-            failed += 1
-
-        # Rate limiting
-        time.sleep(2)
-
-    # Generate product images
-    print("\n[PRODUCTS] Generating product images...")
-    for i, product in enumerate(PRODUCTS, 1):
-        print(f"\n[{i}/{len(PRODUCTS)}] {product['name']}")
-
-        output_path = output_dir / f"{product['code']}.jpg"
-        if output_path.exists():
-            print(f"  [SKIP] Exists: {product['code']}")
-            continue
-
-        prompt = generate_prompt(product)
-        if generate_image(client, prompt, output_path):
-            success += 1
-        else:
-            failed += 1
-
-        # Rate limiting - avoid API throttling
-        time.sleep(2)
+    success, failed = asyncio.run(generate_missing(client, output_dir, args))
 
     # Summary
     print("\n" + "=" * 50)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures for the asset script tests.
+Run from the repo root with: python -m pytest scripts/tests
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+
+# The scripts import the an_assets package from scripts/
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+
+@pytest.fixture
+def load_script():
+    """Import one of the kebab-case scripts in scripts/ as a module."""
+    def load(name: str):
+        spec = importlib.util.spec_from_file_location(name.replace('-', '_'), SCRIPTS_DIR / f"{name}.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
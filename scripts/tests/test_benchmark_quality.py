@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""benchmark-assets.py --prescale-quality scoring."""
+
+import numpy as np
+import pytest
+
+
+def test_psnr_scores_rgbx_renders_as_rgb(load_script):
+    bench = load_script('benchmark-assets')
+    template, size = bench.batch_template('cup', prescaled=True)
+    # render_frame() reuses its buffer, so keep a copy of the first render
+    reference = bench.render_batch(template, size, (120, 80, 50)).copy()
+    distorted = bench.render_batch(template, size, (130, 90, 60))
+    assert reference.mode == distorted.mode == 'RGBX'
+
+    rgb = bench.psnr(reference.convert('RGB'), distorted.convert('RGB'))
+    assert bench.psnr(reference, distorted) == pytest.approx(rgb)
+
+    # Scoring all four channels counts the constant X channel as error-free
+    mse = np.mean((np.asarray(reference, dtype=np.float64) - np.asarray(distorted, dtype=np.float64)) ** 2)
+    assert 10 * np.log10(255 ** 2 / mse) > rgb + 1
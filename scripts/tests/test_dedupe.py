@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""dedupe-images.py alias map across runs."""
+
+import json
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from an_assets import manifest
+
+
+@pytest.fixture
+def dedupe(load_script, tmp_path, monkeypatch):
+    """dedupe-images.py pointed at a temporary public/ and src/ tree."""
+    module = load_script('dedupe-images')
+    products = tmp_path / 'public' / 'images' / 'products'
+    products.mkdir(parents=True)
+    mapping_ts = tmp_path / 'product-images.ts'
+    mapping_ts.write_text(
+        "export const productImages: Record<string, string> = {\n"
+        "  'A': '/images/products/a.jpg',\n"
+        "  'B': '/images/products/b.jpg',\n"
+        "  'A2': '/images/products/a.jpg',\n"
+        "};\n", encoding='utf-8')
+    monkeypatch.setattr(module, 'PUBLIC_DIR', tmp_path / 'public')
+    monkeypatch.setattr(module, 'SOURCE_DIRS', [products])
+    monkeypatch.setattr(module, 'MAPPING_TS', mapping_ts)
+    monkeypatch.setattr(module, 'OUTPUT_PATH', tmp_path / 'aliases.json')
+    monkeypatch.setattr(module, 'REPORT_PATH', tmp_path / 'report.json')
+    monkeypatch.setattr(manifest, 'MANIFEST_DIR', tmp_path / 'manifests')
+
+    gradient = np.tile(np.linspace(0, 255, 64, dtype=np.uint8), (64, 1))
+    drink = Image.fromarray(np.dstack([gradient, gradient.T, np.full_like(gradient, 90)]))
+    other = Image.fromarray(np.dstack([gradient.T, 255 - gradient, gradient]))
+    drink.save(products / 'a.jpg', quality=95)
+    drink.save(products / 'b.jpg', quality=95)
+    other.save(products / 'c.jpg', quality=95)
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['dedupe-images.py', *args])
+        module.main()
+        return json.loads(module.OUTPUT_PATH.read_text(encoding='utf-8'))
+    run.products = products
+    return run
+
+
+def test_aliases_of_applied_files_survive_the_next_run(dedupe):
+    first = dedupe('--apply')
+    assert first == {'/images/products/b.jpg': '/images/products/a.jpg'}
+    assert not (dedupe.products / 'b.jpg').exists()
+
+    # b.jpg is gone from the glob, but product B still needs its alias
+    assert dedupe() == first
+    assert dedupe('--apply') == first
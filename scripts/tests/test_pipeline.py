@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Stage graph of python -m an_assets build."""
+
+from typing import Dict, Set
+
+from an_assets.catalog import load_catalog
+from an_assets.pipeline import STAGES, _expand, select_stages, topological
+
+
+def test_every_default_stage_builds_at_least_one_target():
+    catalog = load_catalog()
+    # Output glob -> products an earlier stage already builds there
+    claimed: Dict[str, Set[str]] = {}
+    for stage in topological(select_stages([])):
+        assert _expand(stage.inputs), f"{stage.name}: no input files"
+        if stage.products is None:
+            continue
+        codes = {product.code for product in getattr(catalog, stage.products)()}
+        earlier = set().union(*(claimed.get(output, set()) for output in stage.outputs))
+        assert codes - earlier, f"{stage.name}: every product is built by an earlier stage"
+        for output in stage.outputs:
+            claimed.setdefault(output, set()).update(codes)
+
+
+def test_stage_product_selectors_exist():
+    catalog = load_catalog()
+    for stage in STAGES:
+        if stage.products is not None:
+            assert callable(getattr(catalog, stage.products)), stage.name
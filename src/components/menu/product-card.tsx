@@ -7,7 +7,7 @@ import { Button } from '@/components/ui/button';
 import { Card, CardContent } from '@/components/ui/card';
 import { Product } from '@/types';
 import { formatPriceShort } from '@/lib/format';
-import { getProductImage } from '@/lib/data/product-images';
+import { getImageLoader, getImagePlaceholder, getProductImage } from '@/lib/data/product-images';
 
 interface ProductCardProps {
   product: Product;
@@ -20,6 +20,7 @@ export function ProductCard({ product, onAddToCart }: ProductCardProps) {
   // Get image from mapping or product data
   const imageUrl = product.image || getProductImage(product.id, product.category);
   const hasImage = Boolean(imageUrl);
+  const blur = getImagePlaceholder(imageUrl);
 
   const handleClick = () => {
     onAddToCart(product, cardRef.current || undefined);
@@ -36,10 +37,13 @@ export function ProductCard({ product, onAddToCart }: ProductCardProps) {
           <>
             <Image
               src={imageUrl}
+              loader={getImageLoader(imageUrl)}
               alt={product.name}
               fill
               className="object-cover group-hover:scale-105 transition-transform duration-300"
               sizes="(max-width: 640px) 50vw, (max-width: 1024px) 33vw, 25vw"
+              placeholder={blur ? 'blur' : 'empty'}
+              blurDataURL={blur?.blurDataURL}
             />
             {/* Badge disclaimer */}
             <div className="absolute bottom-2 left-2 flex items-center gap-1 px-2 py-0.5 bg-black/60 text-white text-[9px] rounded-full backdrop-blur-sm">
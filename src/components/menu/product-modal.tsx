@@ -8,7 +8,7 @@ import { Button } from '@/components/ui/button';
 import { Product, CartItemOption } from '@/types';
 import { formatPriceShort } from '@/lib/format';
 import { cn } from '@/lib/utils';
-import { getProductImage } from '@/lib/data/product-images';
+import { getImageLoader, getImagePlaceholder, getProductImage } from '@/lib/data/product-images';
 import { FlyingCartIcon } from '@/components/animations/flying-cart-icon';
 
 interface ProductModalProps {
@@ -253,6 +253,7 @@ export function ProductModal({
 
   const imageUrl = product.image || getProductImage(product.id, product.category);
   const hasImage = Boolean(imageUrl);
+  const blur = getImagePlaceholder(imageUrl);
   const productOptions = getProductOptions();
 
   const handleOptionChange = (
@@ -363,10 +364,13 @@ export function ProductModal({
             {hasImage ? (
               <Image
                 src={imageUrl}
+                loader={getImageLoader(imageUrl)}
                 alt={product.name}
                 fill
                 className="object-contain p-1"
                 sizes="(max-width: 640px) 112px, 144px"
+                placeholder={blur ? 'blur' : 'empty'}
+                blurDataURL={blur?.blurDataURL}
                 priority
               />
             ) : (
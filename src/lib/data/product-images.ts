@@ -4,6 +4,25 @@
  * Uses paper cup images for AN Milk Tea
  */
 
+import type { ImageLoader } from 'next/image';
+import placeholderIndex from './product-placeholders.json';
+import aliasIndex from './product-image-aliases.json';
+import variantIndex from './product-image-variants.json';
+
+// Blur placeholders written by scripts/generate-placeholders.py
+export interface ImagePlaceholder {
+  blurDataURL: string;
+  color: string;
+}
+
+const imagePlaceholders: Record<string, ImagePlaceholder> = placeholderIndex.images;
+
+// Near-duplicate images mapped to one canonical file by scripts/dedupe-images.py
+const imageAliases: Record<string, string> = aliasIndex;
+
+// Widths of the pre-resized variants written by scripts/generate-image-variants.py
+const imageVariantWidths: Record<string, number[]> = variantIndex.images;
+
 // Default fallback images by category
 export const categoryDefaultImages: Record<string, string> = {
   'tra-sua': '/images/products/tra-sua-default.jpg',
@@ -101,21 +120,44 @@ export const productImages: Record<string, string> = {
 
 /**
  * Get product image URL
- * Falls back to category default, then generic placeholder
+ * Falls back to category default, then generic placeholder.
+ * Near-duplicate images resolve to their canonical file.
  */
 export function getProductImage(productCode: string, category: string): string {
+  let url = '';
+
   // Check specific product image first
   if (productImages[productCode]) {
-    return productImages[productCode];
+    url = productImages[productCode];
+  } else if (categoryDefaultImages[category]) {
+    // Fall back to category default
+    url = categoryDefaultImages[category];
   }
+  return imageAliases[url] ?? url;
+}
 
-  // Fall back to category default
-  if (categoryDefaultImages[category]) {
-    return categoryDefaultImages[category];
-  }
+/**
+ * Blur placeholder and dominant color for an image URL, if generated
+ * Use with next/image: placeholder="blur" blurDataURL={p.blurDataURL}
+ */
+export function getImagePlaceholder(url: string): ImagePlaceholder | undefined {
+  return imagePlaceholders[url];
+}
+
+/**
+ * next/image loader serving an image's pre-resized variants, if generated
+ * Picks the narrowest variant at least as wide as each srcset width.
+ * Use with next/image: loader={getImageLoader(url)}
+ */
+export function getImageLoader(url: string): ImageLoader | undefined {
+  const widths = imageVariantWidths[url];
+  if (!widths?.length) return undefined;
 
-  // Generic fallback
-  return '';
+  return ({ width }) => {
+    const fit = widths.find((w) => w >= width) ?? widths[widths.length - 1];
+    // /images/products/name.jpg -> /images/products/variants/name-300.webp
+    return url.replace(/([^/]+)\.jpg$/, `variants/$1-${fit}.${variantIndex.extension}`);
+  };
 }
 
 /**